@@ -1,7 +1,10 @@
 from __future__ import annotations
+
+from django.db import transaction, connection
+
 from . import Public
 
-from .models import TaskRec, TaskScheme, TaskPackage
+from .models import TaskRec, TaskScheme, TaskPackage, TaskDepend, getNowTimeStamp
 
 if Public.TYPE_CHECKING:
     from .Public import (TaskData, Iterable, )
@@ -35,6 +38,8 @@ def createMultiTask(taskDataArr: Iterable[TaskData, ...], step: str = 1000):
         if not taskDataArr:
             break
 
+    transaction.on_commit(Public.notifyTaskCreated)  # bulk_create 不触发 post_save
+
 
 #       #######                    #               ####   #                    #
 #          #                       #              #    #  #
@@ -50,11 +55,90 @@ def createTaskChain(*taskDataArr: TaskData):
         taskRec = TaskRec(
             **taskData.exportToSaveModel(),
             previousTask=previousTask,
+            pendingDeps=int(previousTask is not None),  # 前置任务是刚创建的任务，写入前就设置为等待
         )
         taskRec.save()
         previousTask = taskRec
 
 
+def createTaskGraph(taskDataArr: Iterable[TaskData, ...], dependArr: Iterable[tuple[int, int]]) -> list[TaskRec]:
+    """
+    创建任务 DAG，dependArr 中的 (taskIndex, dependIndex) 为 taskDataArr 中的序号，表示 taskIndex 依赖 dependIndex
+    """
+    taskDataArr = tuple(taskDataArr)
+    dependSet = set(dependArr)
+
+    pendingArr = [0] * len(taskDataArr)
+    followDict: dict[int, list[int]] = {}
+    for taskIndex, dependIndex in dependSet:
+        assert 0 <= taskIndex < len(taskDataArr) and 0 <= dependIndex < len(taskDataArr), '依赖序号超出范围'
+        pendingArr[taskIndex] += 1
+        followDict.setdefault(dependIndex, []).append(taskIndex)
+
+    # -------------------- 检查循环依赖 --------------------
+    countArr = pendingArr.copy()
+    readyArr = [index for index, count in enumerate(countArr) if not count]
+    visitCount = 0
+    while readyArr:
+        visitCount += 1
+        for taskIndex in followDict.get(readyArr.pop(), ()):
+            countArr[taskIndex] -= 1
+            if not countArr[taskIndex]:
+                readyArr.append(taskIndex)
+    assert visitCount == len(taskDataArr), '依赖关系存在循环'
+
+    taskRecArr = [
+        TaskRec(**taskData.exportToSaveModel(), pendingDeps=pendingArr[index])
+        for index, taskData in enumerate(taskDataArr)
+    ]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            TaskRec.objects.bulk_create(taskRecArr, batch_size=1000)
+        else:  # 不能返回 taskSn 的数据库逐条保存
+            for taskRec in taskRecArr:
+                taskRec.save()
+        TaskDepend.objects.bulk_create(
+            [
+                TaskDepend(task=taskRecArr[taskIndex], dependTask=taskRecArr[dependIndex])
+                for taskIndex, dependIndex in dependSet
+            ],
+            batch_size=1000,
+        )
+        transaction.on_commit(Public.notifyTaskCreated)  # bulk_create 不触发 post_save
+
+    return taskRecArr
+
+
+def addTaskDepend(taskSn: int, dependTaskSnArr: Iterable[int]) -> int:
+    """
+    为等待中的任务添加依赖任务，返回修改的 pendingDeps 数量
+    """
+    dependTaskSnArr = tuple(dependTaskSnArr)
+    with transaction.atomic():
+        assert TaskRec.objects.select_for_update().filter(
+            taskSn=taskSn, taskState__in=(TaskRec.TaskStateChoice.init, TaskRec.TaskStateChoice.crash),
+        ).exists(), f'任务 {taskSn} 不是等待状态'
+
+        # -------------------- 检查循环依赖 --------------------
+        visitSet: set[int] = set()
+        stepSet = set(dependTaskSnArr)
+        while stepSet:
+            assert taskSn not in stepSet, '依赖关系存在循环'
+            visitSet |= stepSet
+            stepSet = set(TaskDepend.objects.filter(
+                task_id__in=stepSet,
+            ).values_list('dependTask_id', flat=True)) | set(TaskRec.objects.filter(
+                taskSn__in=stepSet, previousTask__isnull=False,
+            ).values_list('previousTask_id', flat=True))
+            stepSet -= visitSet
+
+        TaskDepend.objects.bulk_create(
+            [TaskDepend(task_id=taskSn, dependTask_id=dependTaskSn) for dependTaskSn in dependTaskSnArr],
+            ignore_conflicts=True,
+        )
+        return TaskRec.recountPendingDeps(TaskRec.objects.filter(taskSn=taskSn))
+
+
 #       #######                    #             ######                     #
 #          #                       #             #     #                    #
 #          #      ######   #####   #   ##        #     #   ######   #####   #   ##
@@ -90,3 +174,81 @@ def createTaskScheme(
         **taskDataDict,
     )
     taskScheme.save()
+
+
+#       #     #
+#       ##   ##
+#       # # # #   ######  # ####    ######   ######    #####
+#       #  #  #  #     #  ##    #  #     #  #     #  #     #
+#       #     #  #     #  #     #  #     #   ######  #######
+#       #     #  #    ##  #     #  #    ##        #  #
+#       #     #   #### #  #     #   #### #   #####    #####
+
+def cancelTask(
+        *_, tag: str = None, taskPackageSn: int = None, taskSchemeSn: int = None, funcPath: str = None,
+        detail: str = None,
+) -> int:
+    """
+    批量取消未完成的任务，并取消它们的后续任务链，返回取消数量
+    running 任务只标记取消，与 taskRecPreDelete 一致
+    """
+    querySet = TaskRec.selectTask(
+        tag=tag, taskPackageSn=taskPackageSn, taskSchemeSn=taskSchemeSn, funcPath=funcPath,
+    ).filter(taskState__gt=TaskRec.TaskStateChoice.fail, taskState__lt=TaskRec.TaskStateChoice.success, cancel=False)
+
+    with transaction.atomic():
+        taskSnArr = list(querySet.values_list('taskSn', flat=True))
+        updateDict = dict(cancel=True)
+        if detail is not None:
+            updateDict.update(detail=detail)
+        return querySet.update(**updateDict) + TaskRec.cancelFollowTask(taskSnArr)
+
+
+def pauseTask(*_, tag: str = None, taskPackageSn: int = None, taskSchemeSn: int = None, funcPath: str = None) -> int:
+    """
+    批量暂停未完成的任务，后续任务等待前置任务完成，不需要处理
+    """
+    return TaskRec.selectTask(
+        tag=tag, taskPackageSn=taskPackageSn, taskSchemeSn=taskSchemeSn, funcPath=funcPath,
+    ).filter(taskState__lt=TaskRec.TaskStateChoice.success, pause=False).update(pause=True)
+
+
+def resumeTask(*_, tag: str = None, taskPackageSn: int = None, taskSchemeSn: int = None, funcPath: str = None) -> int:
+    """
+    批量恢复暂停的任务，更新 taskStateTime 使增量刷新能发现这些任务
+    """
+    resumed = TaskRec.selectTask(
+        tag=tag, taskPackageSn=taskPackageSn, taskSchemeSn=taskSchemeSn, funcPath=funcPath,
+    ).filter(taskState__lt=TaskRec.TaskStateChoice.success, pause=True).update(
+        pause=False, taskStateTime=getNowTimeStamp(),
+    )
+    if resumed:
+        transaction.on_commit(Public.notifyTaskCreated)  # update 不触发 post_save
+    return resumed
+
+
+def purgeTask(
+        *_, tag: str = None, taskPackageSn: int = None, taskSchemeSn: int = None, funcPath: str = None,
+        step: int = 500,
+) -> int:
+    """
+    批量删除任务，不经过逐条的 taskRecPreDelete，返回删除数量
+    未完成任务的后续任务链标记为取消，running 任务只标记取消
+    """
+    querySet = TaskRec.selectTask(
+        tag=tag, taskPackageSn=taskPackageSn, taskSchemeSn=taskSchemeSn, funcPath=funcPath,
+    )
+    querySet.filter(taskState=TaskRec.TaskStateChoice.running).update(cancel=True)
+
+    removed = 0
+    querySet = querySet.exclude(taskState=TaskRec.TaskStateChoice.running)
+    while True:
+        with transaction.atomic():  # 锁定选中的任务，调度器在删除前无法设置为 running
+            taskSnArr = list(querySet.select_for_update().values_list('taskSn', flat=True)[:step])
+            if not taskSnArr:
+                break
+            TaskRec.cancelFollowTask(list(querySet.filter(
+                taskSn__in=taskSnArr, taskState__lt=TaskRec.TaskStateChoice.success,
+            ).values_list('taskSn', flat=True)), step=step)
+            removed += TaskRec.removeTask(taskSnArr, step=step)
+    return removed
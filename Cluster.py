@@ -1,15 +1,29 @@
 from __future__ import annotations
 
+import gc
+import os
 import signal
 import time
+import warnings
+import importlib
+from collections import deque
 from typing import TYPE_CHECKING
-from multiprocessing import Event, current_process, Pipe, parent_process, Process
+from multiprocessing import Event, current_process, Pipe, parent_process, Process, get_start_method
+from multiprocessing.connection import wait, Connection
 from typing import Callable
 
+from django.db import connections
+
 from . import Public
 
+try:
+    PAGE_SIZE: int = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE: int = 4096
+
 if TYPE_CHECKING:
     from .Dispatcher import DispatcherClient
+    from .Public import (WorkerTaskData, WorkerTaskReport, )
 
 
 #        #####            #        ######
@@ -25,6 +39,8 @@ class WorkerProcess:
             self, *_,
             sn: int, localName: str, workerFunc,
             dispatcher: DispatcherClient, clusterOffline,
+            stateTable: Public.WorkerStateTable,
+            observedFuncPath: set[str] | None = None,
     ):
         self.__sn = sn
         self.__workerProcess: Process | None = None
@@ -32,10 +48,19 @@ class WorkerProcess:
         self.__clusterOffline = clusterOffline
         self.__workerFunc = workerFunc
         self.__localName: str = localName
+        self.__observedFuncPath: set[str] = set() if observedFuncPath is None else observedFuncPath  # 作业器执行过的函数
 
-        self.__workerTimeLimit: int = 0
+        self.__stateTable: Public.WorkerStateTable = stateTable  # 作业器写入心跳和任务截止时间
         self.__workerPipe, self.__pipe = Pipe()
 
+        self.__waitingTask: bool = False  # 作业器正在通过 Pipe 等待任务
+        self.__taskSn: int | None = None  # 通过 Pipe 分发、还未返回结果的任务
+        self.__reportArr: list[WorkerTaskReport] = []
+
+        self.__workerRecycle = Event()  # 通知作业器完成当前任务后退出
+        self.__active: bool = True  # 自动伸缩时未启用的作业器不再重启
+        self.__memoryBase: int = 0  # 首个任务完成时的 RSS，作为内存增长的基准
+
     def __str__(self):
         pid = self.pid
         if pid:
@@ -43,12 +68,9 @@ class WorkerProcess:
 
         return f'作业器-{self.__sn:02d}'
 
-    def refreshWorkerTimeLimit(self, timeLimit=None):
-        if timeLimit is None:
-            self.__workerTimeLimit = Public.getNowStamp() + Public.CONFIG.execTimeLimit + 2
-            return
-
-        self.__workerTimeLimit = Public.getNowStamp() + timeLimit + 2
+    @property
+    def timeLimit(self) -> float:
+        return self.__stateTable.timeLimit(self.__sn)
 
     def createProcess(self):
         if parent_process():
@@ -57,8 +79,12 @@ class WorkerProcess:
 
         while self.__pipe.poll():
             _ = self.__pipe.recv()
+        self.__waitingTask = False
+        self.__taskSn = None  # 终止的作业器的任务不再续约，由租约过期回收
+        self.__workerRecycle.clear()
+        self.__memoryBase = 0
 
-        self.refreshWorkerTimeLimit()
+        self.__stateTable.reset(self.__sn)
 
         self.__workerProcess = Process(
             target=self.__workerFunc,
@@ -68,13 +94,16 @@ class WorkerProcess:
                     clusterOffline=self.__clusterOffline,
                     dispatcherClient=self.__taskDispatcher,
                     pipe=self.__workerPipe,
+                    workerRecycle=self.__workerRecycle,
+                    stateTable=self.__stateTable,
                     localName=self.__localName,
+                    warmUpFuncPath=tuple(self.__observedFuncPath),
                 ),
             ),
         )
         self.__workerProcess.start()
-
-        time.sleep(0.5)
+        if not Public.CONFIG.workerPreload:  # 没有预加载时子进程各自导入模块，错开启动时间
+            time.sleep(0.5)
 
     def isAlive(self):
         if not self.__workerProcess:
@@ -84,12 +113,20 @@ class WorkerProcess:
     def checkProcess(self) -> int:
         while self.__pipe.poll():
             code, value = self.__pipe.recv()
-            if code == 'alive':
-                self.refreshWorkerTimeLimit()
-            if code == 'timeLimit':
-                self.refreshWorkerTimeLimit(value)
+            if code == 'getTask':
+                self.__waitingTask = True
+            if code == 'report':
+                self.__reportArr.append(value)
+                self.__taskSn = None
+            if code == 'funcPath':
+                self.__observedFuncPath.add(value)
+
+        if not self.__active and not self.isAlive():
+            return 0
+
+        self.checkRecycle()
 
-        if self.__workerTimeLimit < time.time():
+        if self.timeLimit < time.time():
             self.workerTerminate()
             time.sleep(1)
 
@@ -102,6 +139,81 @@ class WorkerProcess:
 
         return 0
 
+    def readMemory(self) -> int:
+        """
+        从 /proc 读取作业器的 RSS（字节），无法读取时返回 0
+        """
+        pid = self.pid
+        if not pid:
+            return 0
+        try:
+            with open(f'/proc/{pid}/statm') as statmFile:
+                return int(statmFile.read().split()[1]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def checkRecycle(self):
+        """
+        任务数或内存增长达到上限时通知作业器回收，作业器完成当前任务后退出，由 checkProcess 重启
+        """
+        taskCount = self.__stateTable.taskCount(self.__sn)
+        if self.__workerRecycle.is_set() or not taskCount:
+            return
+
+        if Public.CONFIG.workerMaxTask and taskCount >= Public.CONFIG.workerMaxTask:
+            print(f'{self} 已完成 {taskCount} 个任务，等待回收')
+            self.__workerRecycle.set()
+            return
+
+        if not Public.CONFIG.workerMaxMemory:
+            return
+
+        memory = self.readMemory()
+        if not memory:
+            return
+        if not self.__memoryBase:
+            self.__memoryBase = memory
+            return
+        if memory - self.__memoryBase > Public.CONFIG.workerMaxMemory * 1024 * 1024:
+            print(f'{self} 内存增长 {(memory - self.__memoryBase) // 1024 // 1024} MB，等待回收')
+            self.__workerRecycle.set()
+
+    def activate(self):
+        self.__active = True
+
+    def drain(self):
+        """
+        停用作业器，作业器完成当前任务后退出，之后不再重启
+        """
+        self.__active = False
+        self.__workerRecycle.set()
+
+    @property
+    def active(self) -> bool:
+        return self.__active
+
+    def sendTask(self, taskData: WorkerTaskData):
+        self.__pipe.send(('task', taskData))
+        self.__waitingTask = False
+        self.__taskSn = taskData['taskSn']
+
+    def popReport(self) -> list[WorkerTaskReport]:
+        reportArr = self.__reportArr
+        self.__reportArr = []
+        return reportArr
+
+    @property
+    def waitingTask(self) -> bool:
+        return self.__waitingTask and self.isAlive() and not self.__workerRecycle.is_set()
+
+    @property
+    def taskSn(self) -> int | None:
+        return self.__taskSn if self.isAlive() else None
+
+    @property
+    def pipe(self) -> Connection:
+        return self.__pipe
+
     def workerTerminate(self):
         if not self.isAlive():
             return True
@@ -120,6 +232,13 @@ class WorkerProcess:
     def sn(self):
         return self.__sn
 
+    @property
+    def workerName(self) -> str | None:
+        pid = self.pid
+        if not pid:
+            return None
+        return Public.formatWorkerName(self.__sn, pid)
+
 
 #         ####     ##                         #
 #        #    #     #                         #
@@ -138,6 +257,7 @@ class WorkerCluster:
             raise Exception('需要调度器连接')
 
         self.__dispatcherConn: DispatcherClient = dispatcherConn
+        self.__dispatcherProxy = None  # 统一获取任务时使用的调度器代理
 
         self.__workerFunc = workerFunc
         self.__localName: str = localName
@@ -149,6 +269,19 @@ class WorkerCluster:
         self.__hasTask.clear()
 
         self.__shutdown = False
+        self.__taskBuffer: deque[WorkerTaskData] = deque()  # 统一获取的任务缓冲
+        self.__reportArr: list[WorkerTaskReport] = []  # 等待发送的任务结果，发送失败时保留到下次
+
+        self.__observedFuncPath: set[str] = set()  # 所有作业器共享，重启的作业器预先导入
+
+        if Public.CONFIG.autoScale:  # 按最大数量建立作业器，超出 poolSize 的部分先停用
+            poolSize = min(max(poolSize, Public.CONFIG.poolSizeMin), Public.CONFIG.poolSizeMax)
+            processCount = Public.CONFIG.poolSizeMax
+        else:
+            processCount = poolSize
+        self.__scaleCycle: int = 0  # 连续满足缩减条件的 ping 次数
+
+        self.__stateTable = Public.WorkerStateTable(processCount)
 
         self.__poolSize: int = poolSize
         self.__processPool: tuple[WorkerProcess, ...] = tuple(
@@ -158,9 +291,13 @@ class WorkerCluster:
                 workerFunc=self.__workerFunc,
                 dispatcher=self.__dispatcherConn,
                 localName=self.__localName,
+                stateTable=self.__stateTable,
+                observedFuncPath=self.__observedFuncPath,
             )
-            for i in range(poolSize)
+            for i in range(processCount)
         )
+        for subProcess in self.__processPool[poolSize:]:
+            subProcess.drain()
 
         def shutdownHandler(*_):
             print(f'{self} 接收到关闭信号 @ {Public.currentTimeStr()}')
@@ -180,11 +317,35 @@ class WorkerCluster:
 
         initTime = time.time()
 
+        self.preloadModule()
+
         print(f'{self} >>> 初始化, 子进程 {self.__poolSize} 个')
 
     def __str__(self):
         return f'{self.__localName}-群集-{self.pid}'
 
+    @staticmethod
+    def preloadModule():
+        """
+        在群集进程中预先导入任务模块，作为作业器的模板进程
+        """
+        if not Public.CONFIG.workerPreload:
+            return
+
+        if get_start_method() != 'fork':
+            warnings.warn('workerPreload 需要使用 fork 方式启动子进程')
+
+        for moduleName in Public.CONFIG.workerPreload:
+            try:
+                importlib.import_module(moduleName)
+            except Exception as error:
+                warnings.warn(f'预加载模块 {moduleName} 失败: {error}')
+
+        connections.close_all()  # 导入模块时建立的数据库连接不能被 fork 的作业器共享
+        gc.collect()
+        gc.freeze()
+        print(f'预加载模块 {len(Public.CONFIG.workerPreload)} 个')
+
     def checkSubProcess(self):
         if self.__clusterOffline.is_set():
             return None
@@ -193,6 +354,129 @@ class WorkerCluster:
             if subProcess.checkProcess():
                 return
 
+    def autoScale(self, queueDepth: int):
+        """
+        根据排队任务数和本机负载增减作业器，增加立即生效，减少需要连续 autoScaleIdleCycle 次满足条件
+        """
+        if not Public.CONFIG.autoScale:
+            return
+
+        try:
+            loadOverflow = os.getloadavg()[0] > (os.cpu_count() or 1) * Public.CONFIG.autoScaleMaxLoad
+        except OSError:
+            loadOverflow = False
+
+        activeArr = [subProcess for subProcess in self.__processPool if subProcess.active]
+
+        if not loadOverflow and queueDepth > len(activeArr) * Public.CONFIG.autoScaleUpDepth:
+            self.__scaleCycle = 0
+            if len(activeArr) >= Public.CONFIG.poolSizeMax:
+                return
+            for subProcess in self.__processPool:
+                if not subProcess.active:
+                    subProcess.activate()
+                    print(f'{self} >>> 排队任务 {queueDepth} 个，作业器增加至 {len(activeArr) + 1} 个')
+                    return
+
+        if not loadOverflow and queueDepth > 0:
+            self.__scaleCycle = 0
+            return
+
+        self.__scaleCycle += 1
+        if self.__scaleCycle < Public.CONFIG.autoScaleIdleCycle or len(activeArr) <= Public.CONFIG.poolSizeMin:
+            return
+
+        self.__scaleCycle = 0
+        activeArr[-1].drain()
+        print(f'{self} >>> {"负载过高" if loadOverflow else "队列空闲"}，作业器减少至 {len(activeArr) - 1} 个')
+
+    def nextTimeLimit(self) -> float:
+        """
+        最近一个作业器的终止时间，用于缩短等待，超时的作业器可以及时终止
+        """
+        return min(
+            (subProcess.timeLimit for subProcess in self.__processPool if subProcess.isAlive()),
+            default=time.time() + 1,
+        )
+
+    def waitSubProcess(self, timeout: float):
+        """
+        等待作业器的 Pipe 消息，收到消息立即返回
+        """
+        wait([subProcess.pipe for subProcess in self.__processPool], timeout=timeout)
+
+    @property
+    def dispatcherProxy(self):
+        """
+        调度器代理只建立一次，之后所有调用复用同一个连接
+        """
+        if self.__dispatcherProxy is None:
+            self.__dispatcherProxy = self.__dispatcherConn.taskDispatcher()
+        return self.__dispatcherProxy
+
+    def dispatchTask(self):
+        """
+        群集统一向调度器获取任务，按空闲作业器分发，并批量返回结果
+        """
+        try:
+            dispatcherProxy = self.dispatcherProxy
+        except Exception as err_:
+            print(f'{self} >>> 调度器连接失败: {err_}')
+            return
+
+        for subProcess in self.__processPool:
+            self.__reportArr.extend(subProcess.popReport())
+        if self.__reportArr:
+            try:
+                Public.remoteProxyCall(dispatcherProxy.taskReport, reportArr=self.__reportArr)
+                self.__reportArr = []
+            except Public.ProxyTimeout:
+                self.__dispatcherProxy = None
+                print(f'{self} >>> 任务结果发送失败')
+
+        if self.__clusterOffline.is_set():
+            return
+
+        waitingArr = [subProcess for subProcess in self.__processPool if subProcess.waitingTask]
+        fetchCount = len(waitingArr) - len(self.__taskBuffer)
+        if fetchCount > 0:
+            fetchCount += Public.CONFIG.clusterPrefetch
+            try:
+                fetchData = Public.remoteProxyCall(
+                    dispatcherProxy.getTask,
+                    workerName=f'{self.__localName}-{self.pid}',
+                    combine=fetchCount,
+                    multi=True,
+                    wait=0 if self.__taskBuffer else 0.5,
+                    retry=0,
+                )
+                if isinstance(fetchData, str):
+                    self.__taskBuffer.extend(Public.CONFIG.handler.deserialize(fetchData))
+            except Public.ProxyTimeout:
+                self.__dispatcherProxy = None
+                print(f'{self} >>> 调度器连接失败')
+
+        for subProcess in waitingArr:
+            if not self.__taskBuffer:
+                break
+            subProcess.sendTask(self.__taskBuffer.popleft())
+
+    def returnBufferTask(self):
+        """
+        下线时未分发的任务交还调度器，恢复为 init 状态，不消耗执行次数
+        """
+        reportArr: list[WorkerTaskReport] = [
+            dict(taskSn=taskData['taskSn'], state='release') for taskData in self.__taskBuffer
+        ]
+        self.__taskBuffer.clear()
+        if not reportArr:
+            return
+        try:
+            Public.remoteProxyCall(self.dispatcherProxy.taskReport, reportArr=reportArr)
+        except Exception as err_:
+            self.__reportArr.extend(reportArr)  # 由 dispatchTask 重试
+            print(f'{self} >>> 任务结果发送失败: {err_}')
+
     @property
     def pid(self):
         return current_process().pid
@@ -203,56 +487,91 @@ class WorkerCluster:
             worker.pid for worker in self.__processPool if worker
         ]
 
+    @property
+    def workerName(self) -> list[str]:
+        """
+        存活作业器的名称
+        """
+        workerNameArr = [worker.workerName for worker in self.__processPool]
+        return [workerName for workerName in workerNameArr if workerName]
+
+    @property
+    def holdTaskSn(self) -> list[int]:
+        """
+        统一获取任务时以群集名称分配的任务：存活作业器执行中的、缓冲中的和结果等待发送的
+        """
+        taskSnArr = [worker.taskSn for worker in self.__processPool if worker.taskSn]
+        taskSnArr.extend(taskData['taskSn'] for taskData in self.__taskBuffer)
+        taskSnArr.extend(report['taskSn'] for report in self.__reportArr if report.get('taskSn'))
+        return taskSnArr
+
     @property
     def isOnline(self):
         return not self.__clusterOffline.is_set()
 
     def run(self):
-        dispatcherCheckTime = 0
-        while True:
-            if self.__clusterOffline.is_set():
-                if self.__shutdown:
-                    break
-
-                print(f'{self} >>> 离线 @ {Public.currentTimeStr()}')
-                time.sleep(5)
-
-            if time.time() - dispatcherCheckTime > 10:
-                pingRes = -99
-                try:
-                    pingRes = self.__dispatcherConn.ping(
-                        {
-                            'name': self.__localName,
-                            'pid': self.workerPid,
-                            'status': 'offline' if self.__clusterOffline.is_set() else 'online',
-                        }
-                    )._getvalue()  # Ping 连接 dispatcher
-                except Exception as err_:
-                    print(f'{self} >>> 调度器连接失败: {err_}')
+        try:
+            dispatcherCheckTime = 0
+            while True:
+                if self.__clusterOffline.is_set():
+                    if self.__shutdown:
+                        break
+
+                    print(f'{self} >>> 离线 @ {Public.currentTimeStr()}')
                     time.sleep(5)
 
-                if pingRes > 0:
-                    dispatcherCheckTime = time.time()  # 正常状态更新调度器时间
-                    if self.__clusterOffline.is_set():
-                        print(f'{self} >>> 上线 @ {Public.currentTimeStr()}')
-                        self.__clusterOffline.clear()
+                if time.time() - dispatcherCheckTime > 10:
+                    pingRes = self.pingDispatcher()
+                    if pingRes == -99:
+                        time.sleep(5)
 
-                if pingRes < 0:
-                    if pingRes == -1:  # 结果等于 -1 表示调度器已关闭,执行关闭程序
-                        self.offline()
+                    if pingRes >= 0:
+                        self.autoScale(pingRes)  # 正常状态返回排队的任务数
 
-                    if pingRes < -10:  # 结果小于 -10 表示请求错误，
-                        print(f'{self} >>> 调度器通讯错误: {pingRes}')
+                    if pingRes > 0:
+                        dispatcherCheckTime = time.time()  # 正常状态更新调度器时间
+                        if self.__clusterOffline.is_set():
+                            print(f'{self} >>> 上线 @ {Public.currentTimeStr()}')
+                            self.__clusterOffline.clear()
 
-                if pingRes == 0:
-                    dispatcherCheckTime = time.time()  # 正常状态更新调度器时间
-                    pass  # 空闲状态没有操作
+                    if pingRes < 0:
+                        if pingRes == -1:  # 结果等于 -1 表示调度器已关闭,执行关闭程序
+                            self.offline()
 
-                if time.time() - dispatcherCheckTime > Public.CONFIG.dispatcherTimeout:
-                    self.offline()
+                        if pingRes < -10:  # 结果小于 -10 表示请求错误，
+                            print(f'{self} >>> 调度器通讯错误: {pingRes}')
 
-            self.checkSubProcess()
-            time.sleep(1)
+                    if pingRes == 0:
+                        dispatcherCheckTime = time.time()  # 正常状态更新调度器时间
+                        pass  # 空闲状态没有操作
+
+                    if time.time() - dispatcherCheckTime > Public.CONFIG.dispatcherTimeout:
+                        self.offline()
+
+                self.checkSubProcess()
+                if Public.CONFIG.clusterMultiplex:
+                    self.dispatchTask()
+                self.waitSubProcess(min(max(self.nextTimeLimit() - time.time(), 0.05), 1))
+        finally:
+            self.__stateTable.release()  # 只有群集进程释放共享内存
+
+    def pingDispatcher(self) -> int:
+        """
+        Ping 调度器并为存活作业器的任务续约，连接失败返回 -99
+        """
+        try:
+            return self.__dispatcherConn.ping(
+                {
+                    'name': self.__localName,
+                    'pid': self.workerPid,
+                    'worker': self.workerName,  # 调度器为这些作业器的任务续约
+                    'task': self.holdTaskSn if Public.CONFIG.clusterMultiplex else [],  # 以及这些任务
+                    'status': 'offline' if self.__clusterOffline.is_set() else 'online',
+                }
+            )._getvalue()  # Ping 连接 dispatcher
+        except Exception as err_:
+            print(f'{self} >>> 调度器连接失败: {err_}')
+            return -99
 
     def offline(self):
         if self.__clusterOffline.is_set():
@@ -260,8 +579,14 @@ class WorkerCluster:
 
         self.__clusterOffline.set()  # 激活关闭事件
         print(f'{self} >>> 准备下线')
+        self.returnBufferTask()
 
+        pingTime = time.time()
         while True:
+            if time.time() - pingTime > 10:  # 等待作业器退出期间继续续约，避免执行中的任务租约过期
+                self.pingDispatcher()
+                pingTime = time.time()
+
             subProcessAllExit = True
             for subProcess in self.__processPool:
                 if not subProcess:
@@ -271,6 +596,9 @@ class WorkerCluster:
                 if subProcess.isAlive():
                     subProcessAllExit = False
 
+            if Public.CONFIG.clusterMultiplex:
+                self.dispatchTask()  # 发送下线前完成的任务结果
+
             if subProcessAllExit:
                 print(f'{self} >>> 已下线')
                 return None
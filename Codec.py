@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import lzma
+import zlib
+import base64
+import pickle
+
+from . import Public
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+#         ####                #
+#        #    #               #
+#       #         #####   ######    #####    #####
+#       #        #     #  #     #  #     #  #
+#       #        #     #  #     #  #######  #
+#        #    #  #     #  #     #  #        #
+#         ####    #####   ######    #####    #####
+
+class JsonCodec:
+    """
+    标准库 json，没有格式标记的记录都按 json 解析
+    """
+    name = 'json'
+
+    @staticmethod
+    def encode(data) -> str:
+        return json.dumps(data)
+
+    @staticmethod
+    def decode(dataStr: str):
+        return json.loads(dataStr)
+
+
+class OrjsonCodec:
+    """
+    orjson，与 json 的结果兼容，需要安装 orjson
+    """
+    name = 'orjson'
+
+    @staticmethod
+    def encode(data) -> str:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def decode(dataStr: str):
+        return orjson.loads(dataStr)
+
+
+class MsgpackCodec:
+    """
+    msgpack，二进制结果使用 base64 保存在 TextField 中，需要安装 msgpack
+    """
+    name = 'msgpack'
+
+    @staticmethod
+    def encode(data) -> str:
+        return base64.b64encode(msgpack.packb(data, use_bin_type=True)).decode()
+
+    @staticmethod
+    def decode(dataStr: str):
+        return msgpack.unpackb(base64.b64decode(dataStr), raw=False)
+
+
+class PickleCodec:
+    """
+    pickle，支持任意 python 对象，只能在可信的部署中使用
+    能写入 TaskRec 的用户本来就可以通过 funcPath 执行任意函数，pickle 不会扩大这个范围
+    """
+    name = 'pickle'
+
+    @staticmethod
+    def encode(data) -> str:
+        return base64.b64encode(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)).decode()
+
+    @staticmethod
+    def decode(dataStr: str):
+        return pickle.loads(base64.b64decode(dataStr))
+
+
+codecDict: dict[str, type[JsonCodec]] = {}
+
+
+def registerCodec(codec: type[JsonCodec]):
+    codecDict[codec.name] = codec
+
+
+for _codec in (JsonCodec, PickleCodec, ):
+    registerCodec(_codec)
+if orjson is not None:
+    registerCodec(OrjsonCodec)
+if msgpack is not None:
+    registerCodec(MsgpackCodec)
+
+
+def getCodec(name: str | None) -> type[JsonCodec]:
+    """
+    按格式标记获取 codec，没有标记的旧记录为 json
+    """
+    codec = codecDict.get(name or JsonCodec.name)
+    if codec is None:
+        raise Exception(f'序列化格式 {name} 不可用')
+    return codec
+
+
+def currentCodec() -> type[JsonCodec]:
+    """
+    写入新数据时使用的 codec，由 CONFIG.codec 设置
+    """
+    return getCodec(Public.CONFIG.codec)
+
+
+# -------------------- compress --------------------
+compressorDict = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def compress(dataStr: str) -> str:
+    """
+    超过 CONFIG.compressThreshold 的数据压缩后加上 'zlib:' / 'lzma:' 前缀
+    json 不会以字母开头，base64 中没有 ':'，前缀不会与未压缩的数据混淆
+    """
+    if not Public.CONFIG.compressThreshold or len(dataStr) < Public.CONFIG.compressThreshold:
+        return dataStr
+    compressFunc, _ = compressorDict[Public.CONFIG.compressMethod]
+    compressStr = base64.b64encode(compressFunc(dataStr.encode())).decode()
+    if len(compressStr) >= len(dataStr):  # 压缩无效时保持原样
+        return dataStr
+    return f'{Public.CONFIG.compressMethod}:{compressStr}'
+
+
+def decompress(dataStr: str) -> str:
+    method, sep, _ = dataStr[:5].partition(':')
+    if not sep or method not in compressorDict:
+        return dataStr
+    _, decompressFunc = compressorDict[method]
+    return decompressFunc(base64.b64decode(dataStr[5:])).decode()
+
+
+def encode(data) -> tuple[str, str]:
+    """
+    使用当前 codec 序列化并按需压缩，返回 (dataStr, 格式标记)
+    """
+    codec = currentCodec()
+    return compress(codec.encode(data)), codec.name
+
+
+def decode(dataStr: str, codecName: str | None = None):
+    return getCodec(codecName).decode(decompress(dataStr))
+
+
+__all__ = (
+    'JsonCodec', 'OrjsonCodec', 'MsgpackCodec', 'PickleCodec',
+    'registerCodec', 'getCodec', 'currentCodec', 'compress', 'decompress', 'encode', 'decode',
+)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import time
+import heapq
 import signal
+import threading
 from typing import Callable
 
 from multiprocessing import (current_process, )
@@ -22,7 +24,7 @@ from . import Public, Handler
 # from .Handler import AutoTaskHandler
 
 if Public.TYPE_CHECKING:
-    from .Public import (TaskState, )
+    from .Public import (TaskState, TaskQueueEntryType, WorkerTaskReport, )
 
 
 #   #####       #                                  #               #
@@ -38,14 +40,25 @@ class TaskDispatcher:
     __pid: int = None
 
     def __init__(self, *_, **kwargs):
-        self.__taskQueueLock: bool = False
-        self.__taskQueue: list[TaskState] = []
-        # self.__taskDict: dict[int, TaskState] = {}
+        self.__taskQueueLock = threading.RLock()
+        self.__taskQueueCondition = threading.Condition(self.__taskQueueLock)  # 长轮询 getTask 在此等待
+        self.__taskQueue: list[TaskQueueEntryType] = []  # (priority, 队列顺序, taskState) 的小顶堆
+        self.__taskBlockWaiting: dict[str, list[TaskQueueEntryType]] = {}  # blockKey 被占用而等待的任务
+        self.__runningTaskDict: dict[int, TaskState] = {}  # 已分配的任务
+        self.__queueCounter: int = 0
+        self.__queuedTaskSnSet: set[int] = set()  # 队列和等待中的 taskSn
+        self.__refreshCounter: int = 0
+        self.__refreshWatermark: int | None = None  # 上次刷新时间，增量刷新只查询此后变化的任务
+        self.__queueTruncated: bool = False  # 上次查询达到 queueSize，数据库中还有未加载的任务
         self.__exit: bool = False
         self.__offline: bool = False
         self.__pid = current_process().pid
         self.__clusterDict = {}
         self.__taskBlockSet: set[str] = set()
+        self.__resultBuffer: list[WorkerTaskReport] = []
+        self.__resultRetryDict: dict[int, int] = {}  # 写入失败的结果已重试的次数
+        self.__resultBufferLock = threading.Lock()
+        self.__resultFlushThread: threading.Thread | None = None
 
         print(f'{self} 已启动')
 
@@ -73,6 +86,9 @@ class TaskDispatcher:
 
     def offlineDispatcher(self):
         self.__offline = True
+        with self.__taskQueueCondition:
+            self.__taskQueueCondition.notify_all()  # 唤醒等待中的 getTask
+        self.flushResult()
         return f'{self}准备关闭'
 
     @property
@@ -90,101 +106,451 @@ class TaskDispatcher:
             return
 
         self.__exit = True
+        self.flushResult()
         time.sleep(5)
         exit()
 
-    def refreshTaskQueue(self):
-        # --------------- lock queue --------------------
-        self.__taskQueueLock = True
-
+    def refreshTaskQueue(self) -> int:
+        """
+        刷新队列，返回队列中和运行中的任务数
+        """
         if not self.isRunning():
-            return
-
-        runningBlockKeySet: set[str] = set(
-            taskState.taskData.blockKey for taskState in self.__taskQueue
-            if taskState.workerName is not None and taskState.taskData.blockKey
-        )
-
-        runningBlockKeySet.update(
-            self.__handler.getRunningBlockKey()
-        )
+            return 0
+
+        self.flushResult()  # 先写入缓冲的结果，避免已完成的任务仍占用 blockKey
+        self.__reclaimExpiredLease()
+
+        fullRefresh = self.__refreshWatermark is None \
+                      or self.__refreshCounter % max(Public.CONFIG.queueFullRefreshCycle, 1) == 0 \
+                      or self.__queueTruncated and len(self.__taskQueue) < Public.CONFIG.queueSize // 2
+        # 未加载的任务不会出现在增量查询中，队列消耗过半后全量补充
+        self.__refreshCounter += 1
+        refreshTime = Public.getNowStamp() - 1  # 时间戳精度为秒，增量查询的时间窗口重叠 1 秒
+
+        if not fullRefresh:
+            self.__clearOvertimeTask()
+            newQueue = self.__handler.getTaskQueue(limit=Public.CONFIG.queueSize, changedSince=self.__refreshWatermark)
+            self.__queueTruncated = self.__queueTruncated or len(newQueue) >= Public.CONFIG.queueSize
+            self.__mergeTaskQueue(newQueue)
+            self.__refreshWatermark = refreshTime
+            print(f'调度器队列已增量刷新, 当前任务总数 {len(self.__taskQueue)}')
+            return self.__queueDepth() + len(self.__runningTaskDict)
 
         # --------------- 查询获取新队列 --------------------
+        runningBlockKeySet: set[str] = self.__handler.getRunningBlockKey()
         newQueue: tuple[TaskState] = self.__handler.getTaskQueue(limit=Public.CONFIG.queueSize)
+        self.__queueTruncated = len(newQueue) >= Public.CONFIG.queueSize
 
-        # --------------- set new queue --------------------
-        self.__taskQueue = newQueue
-        self.__taskBlockSet = runningBlockKeySet
+        # --------------- lock queue --------------------
+        with self.__taskQueueLock:
+            self.__clearOvertimeTask()
 
-        print(f'调度器队列已刷新, 当前任务总数 {len(self.__taskQueue)}')
+            runningBlockKeySet.update(
+                taskState.blockKey for taskState in self.__runningTaskDict.values()
+                if taskState.blockKey
+            )
 
-        # --------------- unlock queue --------------------
-        self.__taskQueueLock = False
+            # --------------- set new queue --------------------
+            self.__taskQueue = []
+            self.__taskBlockWaiting = {}
+            self.__queuedTaskSnSet = set()
+            self.__taskBlockSet = runningBlockKeySet
+            self.__mergeTaskQueue(newQueue)
+
+        self.__refreshWatermark = refreshTime
+        print(f'调度器队列已刷新, 当前任务总数 {len(self.__taskQueue)}')
+        return self.__queueDepth() + len(self.__runningTaskDict)
+
+    def __mergeTaskQueue(self, newQueue: tuple[TaskState, ...]):
+        """
+        将新任务加入队列，已在队列中或已分配的任务保持原状态
+        """
+        with self.__taskQueueLock:
+            for taskState in newQueue:
+                if taskState.taskSn in self.__runningTaskDict or taskState.taskSn in self.__queuedTaskSnSet:
+                    continue
+                self.__queueCounter += 1
+                self.__queuedTaskSnSet.add(taskState.taskSn)
+                heapq.heappush(self.__taskQueue, (taskState.priority, self.__queueCounter, taskState))
+
+            if self.__taskQueue:
+                self.__taskQueueCondition.notify_all()
+
+    def __clearOvertimeTask(self):
+        """
+        清除已超时的分配记录，释放对应的 blockKey
+        """
+        currentTime = Public.getNowStamp()
+        with self.__taskQueueLock:
+            for taskState in tuple(self.__runningTaskDict.values()):
+                if taskState.endTime and taskState.endTime + 2 < currentTime:
+                    self.__releaseTask(taskState.taskSn)
+
+    def __renewLease(self, workerNameArr: list[str], taskSnArr: list[int] | None = None):
+        """
+        为存活作业器的任务续约，统一获取任务的群集按 taskSn 续约
+        """
+        if not Public.CONFIG.taskLeaseTime or not isinstance(workerNameArr, (list, tuple)):
+            return
+        workerNameSet = set(workerNameArr)
+        taskSnSet = set(taskSnArr or ())
+        leaseTime = time.time() + Public.CONFIG.taskLeaseTime
+        with self.__taskQueueLock:
+            for taskState in self.__runningTaskDict.values():
+                if taskState.workerName in workerNameSet or taskState.taskSn in taskSnSet:
+                    taskState.leaseTime = leaseTime
+
+    def __reclaimExpiredLease(self):
+        """
+        租约过期的任务说明作业器或群集已失联，释放 blockKey 并批量设置为超时
+        """
+        currentTime = time.time()
+        with self.__taskQueueLock:
+            expiredTaskSnArr = [
+                taskState.taskSn for taskState in self.__runningTaskDict.values()
+                if taskState.leaseTime and taskState.leaseTime < currentTime
+            ]
+            for taskSn in expiredTaskSnArr:
+                self.__releaseTask(taskSn)
+
+        if expiredTaskSnArr:
+            print(f'任务租约过期 {expiredTaskSnArr}')
+            self.__handler.setMultiTaskRecLeaseExpired(taskSnArr=expiredTaskSnArr)
+
+    def __releaseTask(self, taskSn: int) -> TaskState | None:
+        """
+        任务结束后移出分配记录，释放 blockKey 并将等待中的任务放回队列
+        """
+        with self.__taskQueueLock:
+            taskState = self.__runningTaskDict.pop(taskSn, None)
+            if taskState is None:
+                return None
+
+            blockKey = taskState.blockKey
+            if isinstance(blockKey, str):
+                self.__taskBlockSet.discard(blockKey)
+                waitingArr = self.__taskBlockWaiting.pop(blockKey, ())
+                for queueEntry in waitingArr:
+                    heapq.heappush(self.__taskQueue, queueEntry)
+                if waitingArr:
+                    self.__taskQueueCondition.notify(len(waitingArr))
+
+            return taskState
+
+    def __requeueTask(self, taskSn: int):
+        """
+        写入数据库失败的任务移出分配记录，释放 blockKey 并放回队列
+        """
+        with self.__taskQueueLock:
+            taskState = self.__releaseTask(taskSn)
+            if taskState is None or taskSn in self.__queuedTaskSnSet:
+                return
+            taskState.endTime = None
+            taskState.workerName = None
+            taskState.leaseTime = None
+            self.__queueCounter += 1
+            self.__queuedTaskSnSet.add(taskSn)
+            heapq.heappush(self.__taskQueue, (taskState.priority, -self.__queueCounter, taskState))  # 排在同优先级之前
+
+    def __queueDepth(self) -> int:
+        """
+        排队的任务数，包括 blockKey 被占用而等待的任务
+        """
+        with self.__taskQueueLock:
+            return len(self.__taskQueue) + sum(len(waitingArr) for waitingArr in self.__taskBlockWaiting.values())
 
     def statusCode(self):
         if not self.isRunning():
             return -1  # 关闭状态为 -1
 
-        for taskState in self.__taskQueue:
-            if not taskState.workerName:
-                return 1  # 正常状态为 1
+        if self.__queueDepth():
+            return 1  # 正常状态为 1
 
         return 0  # 空闲状态为0
 
-    def getTask(self, *args, workerName: str = None, combine: int = None, **kwargs) -> str | int:
+    def __popTask(self, workerName: str, deadline: float | None = None) -> TaskState | None:
+        """
+        从队列中取出优先级最高且 blockKey 未被占用的任务
+        设置 deadline 时，没有可用任务则等待至队列刷新或 blockKey 释放
+        """
+        with self.__taskQueueCondition:
+            while self.isRunning():
+                selectTask = self.__popReadyTask(workerName)
+                if selectTask is not None or deadline is None:
+                    return selectTask
+
+                waitTime = deadline - time.time()
+                if waitTime <= 0:
+                    return None
+                self.__taskQueueCondition.wait(waitTime)
+
+        return None
+
+    def __popReadyTask(self, workerName: str) -> TaskState | None:
+        with self.__taskQueueLock:
+            while self.__taskQueue:
+                queueEntry = heapq.heappop(self.__taskQueue)
+                taskState = queueEntry[2]
+                blockKey = taskState.blockKey
+
+                if blockKey in self.__taskBlockSet:  # blockKey 被占用，转入等待
+                    self.__taskBlockWaiting.setdefault(blockKey, []).append(queueEntry)
+                    continue
+
+                # --------------- 锁定任务 --------------------
+                self.__queuedTaskSnSet.discard(taskState.taskSn)
+                taskState.workerName = workerName
+                if Public.CONFIG.taskLeaseTime:
+                    taskState.leaseTime = time.time() + Public.CONFIG.taskLeaseTime
+                self.__runningTaskDict[taskState.taskSn] = taskState
+                if isinstance(blockKey, str):
+                    self.__taskBlockSet.add(blockKey)
+                return taskState
+
+        return None
+
+    def getTask(
+            self, *args, workerName: str = None, combine: int = None, wait: float | None = None,
+            multi: bool = False, **kwargs,
+    ) -> str | int:
+        """
+        wait 大于 0 时为长轮询，没有任务则最多等待 wait 秒 ( 不超过 CONFIG.taskWaitTime )
+        combine 大于 1 或 multi 为 True 时返回最多 combine 个任务的列表
+        """
+        deadline = None
+        if wait:
+            deadline = time.time() + min(wait, Public.CONFIG.taskWaitTime)
+
+        if multi or isinstance(combine, int) and combine > 1:
+            return self.__getMultiTask(workerName=workerName, combine=combine, deadline=deadline)
+
         while True:
-            state = self.statusCode()
-            if state <= 0:
-                return state  # 关闭/空闲 状态直接返回
+            if not self.isRunning():
+                return -1  # 关闭状态直接返回
 
-            if self.__taskQueueLock:
-                return 1  # 忙碌状态返回 1
-            selectTask: TaskState | None = None
+            selectTask = self.__popTask(workerName, deadline=deadline)
 
-            # --------------- search all queue --------------------
-            if selectTask is None:
-                for taskState in self.__taskQueue:
-                    if not taskState.done \
-                            and taskState.workerName is None \
-                            and taskState.taskData.blockKey not in self.__taskBlockSet:
-                        selectTask = taskState
-                        break
-
-            # --------------- no task return 1 --------------------
+            # --------------- no task return 0 --------------------
             if selectTask is None:
-                return 0  # 空闲状态返回 0
+                return min(self.statusCode(), 0)  # 空闲状态返回 0
 
-            # --------------- 锁定任务 --------------------
-            selectTask.workerName = workerName
-            if not selectTask.workerName == workerName:
+            try:
+                # --------------- set task running to db --------------------
+                selectTask.endTime = self.__handler.setTaskRunning(
+                    taskSn=selectTask.taskSn,
+                    workerName=selectTask.workerName,
+                    execTimeLimit=selectTask.execTimeLimit,
+                )
+                if not selectTask.endTime:
+                    self.__releaseTask(selectTask.taskSn)
+                    continue
+
+                # --------------- 读取参数字符串 --------------------
+                payload = self.__handler.getTaskPayload(taskSnArr=[selectTask.taskSn]).get(selectTask.taskSn)
+            except Exception as error:
+                print(f'{self} 任务 {selectTask.taskSn} 分配失败: {error}')
+                self.__requeueTask(selectTask.taskSn)
+                return 0
+
+            if payload is None:
+                self.__releaseTask(selectTask.taskSn)
                 continue
 
-            # --------------- set task running to db --------------------
-            selectTask.endTime = self.__handler.setTaskRunning(
-                taskSn=selectTask.taskData.taskSn,
-                workerName=selectTask.workerName,
-            )
-            if not selectTask.endTime:
+            print(f'{workerName} 获取任务 {selectTask.taskSn}')
+            return selectTask.exportToWorker(payload)
+
+    def __getMultiTask(self, workerName: str, combine: int | None, deadline: float | None = None) -> str | int:
+        """
+        一次分配最多 combine 个任务，批量写入 running 状态
+        """
+        while True:
+            if not self.isRunning():
+                return -1
+
+            selectTaskArr: list[TaskState] = []
+            selectTask = self.__popTask(workerName, deadline=deadline)
+            while selectTask is not None:
+                selectTaskArr.append(selectTask)
+                if len(selectTaskArr) >= (combine or 1):
+                    break
+                selectTask = self.__popTask(workerName)
+
+            if not selectTaskArr:
+                return min(self.statusCode(), 0)
+
+            try:
+                # --------------- set task running to db --------------------
+                timeoutDict = self.__handler.setMultiTaskRunning(
+                    taskDataArr=selectTaskArr,
+                    workerName=workerName,
+                )
+
+                payloadDict = self.__handler.getTaskPayload(taskSnArr=timeoutDict.keys()) if timeoutDict else {}
+            except Exception as error:
+                print(f'{self} 任务 {[selectTask.taskSn for selectTask in selectTaskArr]} 分配失败: {error}')
+                for selectTask in selectTaskArr:
+                    self.__requeueTask(selectTask.taskSn)
+                return 0
+
+            runningTaskArr: list[TaskState] = []
+            for selectTask in selectTaskArr:
+                selectTask.endTime = timeoutDict.get(selectTask.taskSn)
+                if not selectTask.endTime or selectTask.taskSn not in payloadDict:
+                    self.__releaseTask(selectTask.taskSn)
+                    continue
+                runningTaskArr.append(selectTask)
+
+            if not runningTaskArr:
                 continue
 
-            if isinstance(selectTask.taskData.blockKey, str):
-                self.__taskBlockSet.add(selectTask.taskData.blockKey)
-            print(f'{workerName} 获取任务 {selectTask.taskData.taskSn}')
-            return selectTask.exportToWorker()
+            print(f'{workerName} 获取任务 {[runningTask.taskSn for runningTask in runningTaskArr]}')
+            return Public.CONFIG.handler.serialize(
+                [runningTask.exportWorkerData(payloadDict[runningTask.taskSn]) for runningTask in runningTaskArr]
+            )
+
+    def __bufferResult(self, report: WorkerTaskReport) -> bool:
+        """
+        开启结果缓冲时将结果放入缓冲区，由后台线程定时批量写入
+        """
+        if Public.CONFIG.resultBufferSize <= 0:
+            return False
+
+        with self.__resultBufferLock:
+            self.__resultBuffer.append(report)
+            bufferFull = len(self.__resultBuffer) >= Public.CONFIG.resultBufferSize
+
+            # --------------- 调度器为 fork 出的进程，在首次使用时启动写入线程 --------------------
+            if self.__resultFlushThread is None or not self.__resultFlushThread.is_alive():
+                self.__resultFlushThread = threading.Thread(target=self.__resultFlushLoop, daemon=True, )
+                self.__resultFlushThread.start()
+
+        if bufferFull:
+            self.flushResult()
+        return True
+
+    def __resultFlushLoop(self):
+        while not self.__exit:
+            time.sleep(Public.CONFIG.resultFlushInterval)
+            self.flushResult()
+
+    def flushResult(self) -> int:
+        """
+        将缓冲的任务结果批量写入数据库
+        """
+        with self.__resultBufferLock:
+            reportArr = self.__resultBuffer
+            self.__resultBuffer = []
+
+        if not reportArr:
+            return 0
+
+        try:
+            updated = self.__handler.setMultiTaskRecResult(reportArr=reportArr)
+        except Exception as error:  # 结果已在接收时序列化，这里只有数据库错误，有限次重试
+            retryArr: list[WorkerTaskReport] = []
+            dropArr: list[int] = []
+            with self.__resultBufferLock:
+                for report in reportArr:
+                    taskSn = report.get('taskSn')
+                    retryCount = self.__resultRetryDict.get(taskSn, 0) + 1
+                    if retryCount > Public.CONFIG.resultRetryLimit:
+                        self.__resultRetryDict.pop(taskSn, None)
+                        dropArr.append(taskSn)
+                        continue
+                    self.__resultRetryDict[taskSn] = retryCount
+                    retryArr.append(report)
+                self.__resultBuffer = retryArr + self.__resultBuffer
+            print(f'{self} 任务结果写入失败: {error}')
+            if dropArr:
+                print(f'{self} 任务结果重试 {Public.CONFIG.resultRetryLimit} 次后丢弃 {dropArr}')
+            return 0
+
+        if self.__resultRetryDict:
+            with self.__resultBufferLock:
+                for report in reportArr:
+                    self.__resultRetryDict.pop(report.get('taskSn'), None)
+        return updated
 
     def taskSuccess(self, *_, taskSn: int = None, result: any = None, execWarn: str | None = None, ):
+        try:
+            result, resultCodec = self.__handler.encodeResult(result)
+        except Exception as error:  # 无法序列化的结果记录为失败，不进入缓冲区
+            return self.taskCrash(
+                taskSn=taskSn, message='任务结果无法序列化', detail=f'{type(error).__name__}: {error}',
+                execWarn=execWarn,
+            )
+
         print(f'{taskSn} 任务完成')
+        self.__releaseTask(taskSn)
+        if self.__bufferResult(dict(
+                taskSn=taskSn, state='success', result=result, resultCodec=resultCodec, execWarn=execWarn,
+        )):
+            return True
         return self.__handler.setTaskRecSuccess(
-            taskSn=taskSn, result=result, execWarn=execWarn,
+            taskSn=taskSn, result=result, resultCodec=resultCodec, execWarn=execWarn,
         )
 
-    def taskCrash(self, *_, taskSn: int, message: str, detail: str, execWarn: str | None = None, ):
+    def taskCrash(
+            self, *_, taskSn: int, message: str, detail: str, execWarn: str | None = None,
+            errorCode: int = Handler.TaskRec.ErrorCodeChoice.crash,
+    ):
         print(f'{taskSn} 任务失败: {message}')
+        self.__releaseTask(taskSn)
+        if self.__bufferResult(dict(
+                taskSn=taskSn, state='crash', errorCode=errorCode,
+                message=message, detail=detail, execWarn=execWarn,
+        )):
+            return True
         return self.__handler.setTaskRecCrash(
-            taskSn=taskSn, message=message, detail=detail, execWarn=execWarn,
+            taskSn=taskSn, message=message, detail=detail, execWarn=execWarn, errorCode=errorCode,
         )
 
+    def taskReport(self, *_, reportArr: list[WorkerTaskReport]):
+        """
+        批量接收任务结果
+        """
+        resultArr = []
+        releaseArr = []
+        for report in reportArr:
+            taskSn = report.get('taskSn')
+            match report.get('state'):
+                case 'success':
+                    resultArr.append(self.taskSuccess(
+                        taskSn=taskSn, result=report.get('result'), execWarn=report.get('execWarn'),
+                    ))
+                case 'crash':
+                    resultArr.append(self.taskCrash(
+                        taskSn=taskSn, message=report.get('message'), detail=report.get('detail'),
+                        execWarn=report.get('execWarn'),
+                    ))
+                case 'timeout':
+                    resultArr.append(self.taskCrash(
+                        taskSn=taskSn, message=report.get('message'), detail=report.get('detail'),
+                        execWarn=report.get('execWarn'),
+                        errorCode=Handler.TaskRec.ErrorCodeChoice.timeout,
+                    ))
+                case 'invalidConfig':
+                    resultArr.append(self.taskCrash(
+                        taskSn=taskSn, message='配置无效', detail=report.get('detail'),
+                        errorCode=Handler.TaskRec.ErrorCodeChoice.invalidConfig,
+                    ))
+                case 'release':
+                    releaseArr.append(taskSn)
+                    resultArr.append(True)
+                case _:
+                    resultArr.append(False)
+
+        if releaseArr:  # 未执行的任务恢复为 init 并放回队列，不消耗执行次数
+            self.__handler.setMultiTaskRecRelease(taskSnArr=releaseArr)
+            for taskSn in releaseArr:
+                self.__requeueTask(taskSn)
+        return resultArr
+
     def invalidConfig(self, *_, runningWorkerName: str, detail: str = None):
+        with self.__taskQueueLock:
+            for taskState in tuple(self.__runningTaskDict.values()):
+                if taskState.workerName == runningWorkerName:
+                    self.__releaseTask(taskState.taskSn)
         return self.__handler.setTaskRecInvalidConfig(runningWorkerName=runningWorkerName, detail=detail)
 
     def ping(self, state, *_, ):
@@ -192,12 +558,17 @@ class TaskDispatcher:
             clusterName = state.get('name')
             print(f'群集 {clusterName} ping 了一下')
             self.__clusterDict[clusterName] = state
+            self.__renewLease(state.get('worker'), state.get('task'))  # 续约随 ping 一起发送
 
         else:
             print('Ping 消息无效')
             return -99  # -99 表示错误信息
 
-        return self.statusCode()  # 0 空闲
+        statusCode = self.statusCode()
+        if statusCode <= 0:
+            return statusCode  # 0 空闲
+
+        return max(self.__queueDepth(), 1)  # 正常状态返回排队的任务数，群集据此自动伸缩
 
     def status(self):
         return {
@@ -206,9 +577,9 @@ class TaskDispatcher:
             'cluster': self.__clusterDict.values(),
             'runningTask': [
                 {
-                    'taskSn': taskState.taskData.taskSn,
+                    'taskSn': taskState.taskSn,
                     'executor': taskState.workerName,
-                } for taskState in self.__taskQueue if taskState.workerName
+                } for taskState in tuple(self.__runningTaskDict.values())
             ],
         }
 
@@ -234,12 +605,17 @@ class DispatcherServer(BaseManager):
             return
 
         taskDispatcher = TaskDispatcher()
+        exposedArr = []
         for name_ in taskDispatcher.__dir__():
             if name_[0] == '_':
                 continue
             func_ = getattr(taskDispatcher, name_)
             if callable(func_):
                 cls.register(name_, func_, )
+                exposedArr.append(name_)
+
+        # --------------- 调度器代理，在同一个连接上直接调用方法并返回结果 --------------------
+        cls.register('taskDispatcher', lambda: taskDispatcher, exposed=tuple(exposedArr), )
 
         cls.__methodBounded = True
 
@@ -292,12 +668,15 @@ class DispatcherClient(BaseManager):
     taskSuccess: Callable
     taskCrash: Callable
     taskTimeout: Callable
+    taskReport: Callable
     invalidConfig: Callable
+    taskDispatcher: Callable
 
     __methodBounded = False
     dispatcherClientFunc = (
         'ping', 'getTask',
-        'taskSuccess', 'taskCrash', 'taskTimeout', 'invalidConfig',
+        'taskSuccess', 'taskCrash', 'taskTimeout', 'taskReport', 'invalidConfig',
+        'taskDispatcher',
     )
 
     def __init__(self, *args, **kwargs):
@@ -1,5 +1,4 @@
 from __future__ import annotations
-import json
 
 from django.core.exceptions import AppRegistryNotReady
 from django.apps.registry import apps
@@ -11,10 +10,10 @@ except AppRegistryNotReady:
 
     django.setup()
 
-from . import Public
+from . import Public, Codec
 
 if Public.TYPE_CHECKING:
-    from .Public import TaskState
+    from .Public import (TaskState, TaskData, TaskPayloadType, WorkerTaskReport, Iterable, )
 
 from .models import TaskScheme, TaskRec
 
@@ -23,29 +22,48 @@ class AutoTaskHandler:
     # -------------------- serialize --------------------
     @classmethod
     def serialize(cls, data: dict | list | tuple) -> str:
-        return json.dumps(data)
+        return Codec.currentCodec().encode(data)
 
     @classmethod
     def deserialize(cls, dataStr) -> dict | list:
-        return json.loads(dataStr)
+        return Codec.currentCodec().decode(dataStr)
 
     # -------------------- TaskRec --------------------
     @classmethod
-    def getTaskQueue(cls, *_, taskType: int | None = None, limit: int | None = None) -> tuple[TaskState, ...]:
-        querySet = TaskRec.getTaskQueue(taskType=taskType, size=limit)
-        taskDataArr = TaskRec.exportQueryTaskData(querySet)
-        return tuple(Public.TaskState(taskData=taskData) for taskData in taskDataArr)
+    def getTaskQueue(
+            cls, *_, taskType: int | None = None, limit: int | None = None, changedSince: int | None = None,
+    ) -> tuple[TaskState, ...]:
+        querySet = TaskRec.getTaskQueue(taskType=taskType, size=limit, changedSince=changedSince)
+        return TaskRec.exportQueryTaskState(querySet)
+
+    @classmethod
+    def nextDueTime(cls) -> int | None:
+        return TaskRec.nextDueTime()
+
+    @classmethod
+    def getTaskPayload(cls, *_, taskSnArr: Iterable[int]) -> dict[int, TaskPayloadType]:
+        return TaskRec.queryTaskPayload(taskSnArr)
+
+    @classmethod
+    def encodeResult(cls, result: any) -> tuple[str, str]:
+        """
+        序列化任务结果，返回 (result, resultCodec)
+        """
+        return Codec.encode(result)
 
     @classmethod
     def setTaskRecSuccess(
             cls, *_, taskSn: int,
-            result: any, execWarn: str | None = None,
+            result: str, resultCodec: str | None = None, execWarn: str | None = None,
     ):
+        """
+        result 需要已经由 encodeResult 序列化
+        """
         taskRec = TaskRec.manageTaskRec(taskSn=taskSn)
         if taskRec is None:
             return False
         return taskRec.setSuccess(
-            result=cls.serialize(result),
+            result=result, resultCodec=resultCodec,
             execWarn=execWarn,
         )
 
@@ -53,18 +71,26 @@ class AutoTaskHandler:
     def setTaskRecCrash(
             cls, *_, taskSn: int,
             message: str, detail: str, execWarn: str | None = None,
+            errorCode: int = TaskRec.ErrorCodeChoice.crash,
     ):
         taskRec = TaskRec.manageTaskRec(taskSn=taskSn)
         if taskRec is None:
             return False
 
         return taskRec.setError(
-            errorCode=TaskRec.ErrorCodeChoice.crash,
+            errorCode=TaskRec.ErrorCodeChoice(errorCode),
             message=message,
             detail=detail,
             execWarn=execWarn,
         )
 
+    @classmethod
+    def setMultiTaskRecResult(cls, *_, reportArr: Iterable[WorkerTaskReport]) -> int:
+        """
+        批量写入任务结果，返回更新的记录数，report 中的 result 需要已经由 encodeResult 序列化
+        """
+        return TaskRec.setMultiResult(reportArr=reportArr)
+
     @classmethod
     def getRunningBlockKey(cls) -> set[str]:
         return TaskRec.getRunningBlockKey()
@@ -78,24 +104,45 @@ class AutoTaskHandler:
 
     @classmethod
     def overtimeTaskProcess(cls):
-        overtimeTaskArr = TaskRec.queryOvertimeTask()
-        for overtimeTaskRec in overtimeTaskArr:
-            overtimeTaskRec.setError(
-                errorCode=TaskRec.ErrorCodeChoice.timeout,
-                message='任务超时',
-            )
-            print(f'任务 {TaskRec.taskSn} 超时')
+        overtimeCount = TaskRec.reclaimRunning(TaskRec.queryOvertimeTask(), message='任务超时')
+        if overtimeCount:
+            print(f'{overtimeCount} 个任务超时')
 
     @classmethod
-    def setTaskRunning(cls, *_, taskSn: int, workerName: str) -> int | None:
+    def setMultiTaskRecLeaseExpired(cls, *_, taskSnArr: Iterable[int]) -> int:
+        """
+        租约过期的任务批量设置为超时
+        """
+        return TaskRec.reclaimRunning(TaskRec.objects.filter(taskSn__in=taskSnArr), message='任务租约过期')
+
+    @classmethod
+    def setMultiTaskRecRelease(cls, *_, taskSnArr: Iterable[int]) -> int:
+        """
+        已分配但未执行的任务批量恢复为 init，等待重新分配
+        """
+        return TaskRec.releaseRunning(TaskRec.objects.filter(taskSn__in=taskSnArr))
+
+    @classmethod
+    def setTaskRunning(cls, *_, taskSn: int, workerName: str, execTimeLimit: int | None = None) -> int | None:
         """
         根据 taskSn 设置 TaskRec 为 running 状态
+        提供 execTimeLimit 时使用单条 UPDATE 原子设置
         """
+        if isinstance(execTimeLimit, int):
+            return TaskRec.claimRunning(taskSn=taskSn, workerName=workerName, execTimeLimit=execTimeLimit)
+
         taskRec = TaskRec.manageTaskRec(taskSn=taskSn)
         if taskRec is None:
             return None
         return taskRec.setRunning(workerName=workerName, )
 
+    @classmethod
+    def setMultiTaskRunning(cls, *_, taskDataArr: Iterable[TaskData | TaskState], workerName: str) -> dict[int, int]:
+        """
+        批量设置 TaskRec 为 running 状态，返回成功设置的 {taskSn: timeout}
+        """
+        return TaskRec.setMultiRunning(taskDataArr=taskDataArr, workerName=workerName)
+
     @classmethod
     def taskSchemeAuto(cls):
         TaskScheme.dueSchemeApply()
@@ -103,5 +150,20 @@ class AutoTaskHandler:
         #     scheme.schemeApply()
 
     @classmethod
-    def expireTaskProcess(cls):
-        pass
+    def pendingDepsProcess(cls):
+        repairCount = TaskRec.repairPendingDeps()
+        if repairCount:
+            print(f'{repairCount} 个任务的依赖计数已修复')
+
+    @classmethod
+    def expireTaskProcess(cls) -> int:
+        """
+        分批删除超过保留时间的任务，每次最多 CONFIG.retainBatchLimit 批，返回删除数量
+        """
+        removed = 0
+        for _ in range(Public.CONFIG.retainBatchLimit):
+            count = TaskRec.removeExpired(size=Public.CONFIG.retainBatchSize)
+            removed += count
+            if count < Public.CONFIG.retainBatchSize:
+                break
+        return removed
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-import json
 import time
+import socket
+import struct
 import warnings
 
 import traceback
@@ -15,6 +16,8 @@ from types import (FunctionType, )
 
 from multiprocessing import Event
 from multiprocessing.connection import Connection
+from multiprocessing.managers import BaseProxy
+from multiprocessing.shared_memory import SharedMemory
 
 import dataclasses
 from dataclasses_json import dataclass_json
@@ -44,15 +47,22 @@ def currentTimeStr(formatStr: str = '%Y%m%d%H:%M:%S'):
 
 # -------------------- import component by string --------------------
 importCache = {}
+importCacheStat = dict(hit=0, miss=0, )  # 缓存命中统计
 
 
 def importComponent(path: str, *_, forceLoad: bool = False, cache: dict | None = None) -> any:
+    """
+    根据路径导入对象，结果按 path 缓存，forceLoad 时重新加载模块并刷新缓存
+    """
     if cache is None:
         cache = importCache
 
     if path in cache and not forceLoad:
+        importCacheStat['hit'] += 1
         return cache[path]
 
+    importCacheStat['miss'] += 1
+
     # pathParts = [part for part in path.split('.') if part]
     pathParts = path.split('.')
     n = len(pathParts)
@@ -71,7 +81,10 @@ def importComponent(path: str, *_, forceLoad: bool = False, cache: dict | None =
 
     if not hasattr(importModule, '.'.join(pathParts[n:])):
         raise Exception(f'{path} not exist')
-    return getattr(importModule, '.'.join(pathParts[n:]))
+
+    component = getattr(importModule, '.'.join(pathParts[n:]))
+    cache[path] = component
+    return component
 
 
 def importFunction(path: str, *_, forceLoad: bool = False, cache: dict | None = None) -> FunctionType:
@@ -87,6 +100,20 @@ def importFunction(path: str, *_, forceLoad: bool = False, cache: dict | None =
     return func
 
 
+def warmUpFunction(pathArr: Iterable[str]) -> int:
+    """
+    预先导入任务函数写入缓存，返回成功的数量
+    """
+    count = 0
+    for path in pathArr:
+        try:
+            importFunction(path)
+            count += 1
+        except Exception as error:
+            warn(f'预加载函数 {path} 失败: {error}')
+    return count
+
+
 # -------------------- config --------------------
 autoTaskConfig = getattr(settings, 'AUTO_TASK', dict())
 
@@ -100,12 +127,47 @@ class AutoTaskConfig:
     host: str = 'localhost'
     port: int = 8890
     queueSize: int = 500
+    queueFullRefreshCycle: int = 1  # 每几次刷新执行一次全量刷新，其余为增量刷新，1 表示每次都全量刷新
     dispatcherTimeout: int = 120
+    notifyPort: int = 8891  # 新任务通知的 UDP 端口
+    notifyHost: str = '0.0.0.0'  # 调度器监听新任务通知的地址，通知只触发刷新队列
+    queueRefreshInterval: int = 5  # 队列刷新间隔
+    queueIdleRefreshInterval: int = 30  # 队列空闲时的刷新间隔，新任务会通过通知立即刷新，不超过下一个任务的计划时间
+    queueRefreshMinInterval: float = 1  # 两次刷新的最小间隔，频繁的新任务通知合并为一次刷新
+    resultBufferSize: int = 0  # 任务结果缓冲数量，0 表示直接写入数据库
+    resultFlushInterval: float = 1  # 任务结果缓冲写入间隔
+    resultRetryLimit: int = 3  # 缓冲的结果写入数据库失败后最多重试几次，超过后丢弃，任务由超时检查回收
+    taskWaitTime: int = 5  # getTask 长轮询最长等待时间，0 表示不等待
+    codec: str = 'json'  # 参数和结果的序列化格式：json / orjson / msgpack / pickle，记录在 TaskRec 中
+    compressThreshold: int = 0  # 参数和结果超过多少字符时压缩，0 表示不压缩
+    compressMethod: str = 'zlib'  # 压缩方式：zlib / lzma
+    taskLeaseTime: int = 30  # 任务租约时长，群集每 10 秒 ping 时为存活的作业器续约，0 表示不使用租约
+    taskRetainTime: int = 86400 * 7  # 不属于计划的 success / fail 任务保留时间，计划任务使用 TaskScheme.retainTime，0 表示不清理
+    retainCheckInterval: int = 300  # 清理过期任务、修复依赖计数的间隔
+    retainBatchSize: int = 1000  # 清理过期任务时每批删除的数量
+    retainBatchLimit: int = 10  # 每次清理最多删除的批数，剩余的下次继续
 
     # cluster
     name: str = 'AutoTask'
     poolSize: int = 2
     workerLifetime: int = 600
+    workerMaxMemory: int = 0  # 作业器内存（RSS）比首个任务完成时增长超过多少 MB 后回收，0 表示不限制
+    workerMaxTask: int = 0  # 作业器完成多少个任务后回收，0 表示不限制
+    autoScale: bool = False  # 根据调度器的排队任务数和本机负载自动调整作业器数量
+    poolSizeMin: int = 1  # 自动伸缩时的最少作业器数量
+    poolSizeMax: int = 4  # 自动伸缩时的最多作业器数量
+    autoScaleUpDepth: int = 2  # 排队任务数超过 作业器数量 x 此值 时增加作业器
+    autoScaleMaxLoad: float = 0.9  # 1 分钟负载超过 CPU 数量 x 此值 时不再增加，并逐步减少作业器
+    autoScaleIdleCycle: int = 3  # 连续多少次 ping 队列为空或负载过高后减少一个作业器
+    taskCombine: int = 1  # 作业器每次获取的任务数
+    clusterMultiplex: bool = False  # 群集使用一个连接统一获取任务，通过 Pipe 分发给作业器
+    clusterPrefetch: int = 1  # 群集统一获取时，额外预取的任务数
+    workerPreload: tuple[str, ...] = ()  # 群集进程预先导入的任务模块，作业器从预热的群集进程 fork
+    workerWarmUp: tuple[str, ...] = ()  # 作业器启动时预先导入的任务函数 funcPath
+    workerAsyncLimit: int = 1  # 大于 1 时作业器使用 asyncio 并发执行任务的数量
+    workerThreadLimit: int = 1  # 大于 1 时作业器使用线程池并发执行任务的数量
+    softTimeout: bool = True  # 任务超时时只中断任务，作业器继续运行
+    hardTimeoutDelay: int = 5  # 软超时后仍未结束的作业器，再等待多少秒后强制终止
 
     # task
     execTimeLimit: int = 20
@@ -129,6 +191,25 @@ class AutoTaskConfig:
 CONFIG = AutoTaskConfig(**autoTaskConfig)
 
 
+# -------------------- new task notify --------------------
+notifySocket: socket.socket | None = None
+
+
+def notifyTaskCreated():
+    """
+    通知调度器有新任务，调度器收到后立即刷新队列
+    使用 UDP 发送，调度器未启动时直接忽略
+    """
+    global notifySocket
+    try:
+        if notifySocket is None:
+            notifySocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            notifySocket.setblocking(False)
+        notifySocket.sendto(b'1', (CONFIG.host, CONFIG.notifyPort))
+    except OSError:
+        pass
+
+
 # -------------------- read only dict --------------------
 
 class ReadonlyDict(dict):
@@ -161,6 +242,9 @@ class WorkerProcessConfig:
     dispatcherClient: DispatcherClient
     clusterOffline: Event
     pipe: Connection
+    workerRecycle: Event  # 群集要求作业器完成当前任务后退出
+    stateTable: WorkerStateTable  # 与群集共享的心跳和任务状态，按 sn 使用其中一格
+    warmUpFuncPath: tuple[str, ...] = ()  # 启动时预先导入的任务函数
 
 
 class WorkerTaskData(TypedDict):
@@ -169,8 +253,21 @@ class WorkerTaskData(TypedDict):
     execTimeLimit: int
 
     funcPath: str
-    args: list
-    kwargs: dict
+    argsStr: str  # 与 TaskRec 中保存的字符串相同，由作业器解析
+    kwargsStr: str
+    argsCodec: str | None
+
+
+class WorkerTaskReport(TypedDict, total=False):
+    taskSn: int
+    state: str  # success / crash / timeout / invalidConfig / release
+    errorCode: int
+
+    result: any
+    resultCodec: str  # 调度器接收结果时序列化 result 并设置
+    message: str
+    detail: str
+    execWarn: str | None
 
 
 @dataclass_json
@@ -184,6 +281,8 @@ class TaskData:
 
     execTimeLimit: int
 
+    argsCodec: str | None = None  # argsStr / kwargsStr 的序列化格式，None 为 json
+
     taskSn: int = None
     priority: int = None
     blockKey: str | None = None
@@ -197,26 +296,21 @@ class TaskData:
             blockKey: str = None, execTimeLimit: int = None, priority: int = None,
             note: str = None, tag: str = None,
     ) -> TaskData:
+        from . import Codec
+
         assert isfunction(func), '无效的 func'
         funcPath = f'{getmodule(func).__name__}.{func.__name__}'
 
+        argsStr, argsCodec = Codec.encode(list(args or ()))
+        kwargsStr, _ = Codec.encode(kwargs or {})
         packData = dict(
             funcPath=funcPath,
-            argsStr='[]',
-            kwargsStr='{}',
+            argsStr=argsStr,
+            kwargsStr=kwargsStr,
+            argsCodec=argsCodec,
             execTimeLimit=CONFIG.execTimeLimit,
         )
 
-        if args:
-            packData.update(
-                argsStr=CONFIG.handler.serialize(args)
-            )
-
-        if kwargs:
-            packData.update(
-                kwargsStr=CONFIG.handler.serialize(kwargs)
-            )
-
         if execTimeLimit is not None:
             packData.update(
                 execTimeLimit=execTimeLimit
@@ -240,57 +334,132 @@ class TaskData:
 
         return dataDict
 
-    def exportToWorker(self) -> str:
-        dataDict: WorkerTaskData = dict(
-            taskSn=self.taskSn,
-            name=self.name,
-            funcPath=self.funcPath,
-            args=json.loads(self.argsStr),
-            kwargs=json.loads(self.kwargsStr),
-            execTimeLimit=self.execTimeLimit,
-        )
-        return CONFIG.handler.serialize(dataDict)
-
 
 TaskDataArrayType: TypeAlias = list[TaskData, ...] | tuple[TaskData, ...]
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class TaskState:
-    taskData: TaskData
+    """
+    调度器队列中的任务，只保存调度需要的字段，参数字符串在分配任务时才从数据库读取
+    """
+    taskSn: int
+    priority: int
+    execTimeLimit: int
+    name: str
+    funcPath: str
+    blockKey: str | None = None
 
     endTime: int = None
     workerName: str = None
-    done: bool = False
+    leaseTime: float = None  # 租约到期时间，群集 ping 时续约
 
     def __post_init__(self):
-        assert self.taskData.taskSn, '没有 taskSn 的任务无法加载'
-        assert self.taskData.priority is not None, '没有 priority 的任务无法加载'
-
-    def exportToWorker(self) -> str:
-        return self.taskData.exportToWorker()
-
-    @property
-    def priority(self) -> int:
-        return self.taskData.priority
+        assert self.taskSn, '没有 taskSn 的任务无法加载'
+        assert self.priority is not None, '没有 priority 的任务无法加载'
+
+    def exportWorkerData(self, payload: TaskPayloadType) -> WorkerTaskData:
+        """
+        参数字符串原样转发，调度器不解析，由作业器解析一次
+        """
+        argsStr, kwargsStr, argsCodec = payload
+        return dict(
+            taskSn=self.taskSn,
+            name=self.name,
+            funcPath=self.funcPath,
+            argsStr=argsStr,
+            kwargsStr=kwargsStr,
+            argsCodec=argsCodec,
+            execTimeLimit=self.execTimeLimit,
+        )
 
-    @property
-    def taskSn(self) -> int:
-        return self.taskData.taskSn
+    def exportToWorker(self, payload: TaskPayloadType) -> str:
+        return CONFIG.handler.serialize(self.exportWorkerData(payload))
 
 
 TaskStateArrayType: TypeAlias = list[TaskState, ...] | tuple[TaskState, ...]
+TaskQueueEntryType: TypeAlias = tuple[int, int, TaskState]  # (priority, 队列顺序, taskState)
+TaskPayloadType: TypeAlias = tuple[str, str, str | None]  # (argsStr, kwargsStr, argsCodec)
 
 
 class ProxyTimeout(Exception):
     pass
 
 
+class TaskTimeout(BaseException):
+    """
+    软超时时在任务中抛出，继承 BaseException 避免被任务中的 except Exception 捕获
+    """
+    pass
+
+
+class WorkerStateTable:
+    """
+    群集与作业器共享内存中的状态表，每个作业器一格，只由作业器自己写入
+    格式：心跳时间, 当前 taskSn, 任务截止时间（0 表示没有执行中的任务）, 已完成任务数
+    """
+    slotStruct = struct.Struct('<dqdq')
+
+    def __init__(self, slotCount: int):
+        self.__sharedMemory = SharedMemory(create=True, size=self.slotStruct.size * max(slotCount, 1))
+
+    def __read(self, sn: int) -> tuple[float, int, float, int]:
+        return self.slotStruct.unpack_from(self.__sharedMemory.buf, self.slotStruct.size * (sn - 1))
+
+    def __write(self, sn: int, heartbeat: float, taskSn: int, deadline: float, taskCount: int):
+        self.slotStruct.pack_into(
+            self.__sharedMemory.buf, self.slotStruct.size * (sn - 1),
+            heartbeat, taskSn, deadline, taskCount,
+        )
+
+    def reset(self, sn: int):
+        self.__write(sn, time.time(), 0, 0, 0)
+
+    def beat(self, sn: int, *_, taskSn: int = 0, deadline: float = 0):
+        """
+        作业器写入心跳，有执行中的任务时同时写入 taskSn 和截止时间
+        """
+        self.__write(sn, time.time(), taskSn, deadline, self.__read(sn)[3])
+
+    def addTaskCount(self, sn: int, count: int = 1):
+        heartbeat, taskSn, deadline, taskCount = self.__read(sn)
+        self.__write(sn, heartbeat, taskSn, deadline, taskCount + count)
+
+    def taskCount(self, sn: int) -> int:
+        return self.__read(sn)[3]
+
+    def timeLimit(self, sn: int) -> float:
+        """
+        作业器的终止时间，有任务时为任务截止时间，否则为最后心跳加 execTimeLimit
+        """
+        heartbeat, taskSn, deadline, taskCount = self.__read(sn)
+        if deadline:
+            return deadline + 2
+        return heartbeat + CONFIG.execTimeLimit + 2
+
+    def release(self):
+        self.__sharedMemory.close()
+        try:
+            self.__sharedMemory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def formatWorkerName(sn: int, pid: int) -> str:
+    """
+    作业器名称，记录在 TaskRec.workerName 中，群集 ping 时据此为作业器的任务续约
+    """
+    return f'{CONFIG.name}-{sn:02d}-{pid:<5d}'
+
+
 def remoteProxyCall(func: Callable, *args, retry=5, **kwargs):
     retryCounter = 0
     while retryCounter < retry + 1:
         try:
-            return func(*args, **kwargs)._getvalue()
+            result = func(*args, **kwargs)
+            if isinstance(result, BaseProxy):
+                return result._getvalue()
+            return result  # 通过 taskDispatcher 代理调用时直接返回结果
         except Exception as err_:
             print(f'  Proxy function {func.__name__} call error: {err_}')
             retryCounter = retryCounter + 1
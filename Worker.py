@@ -2,25 +2,205 @@ from __future__ import annotations
 
 import time
 import signal
+import asyncio
+import warnings
 import traceback
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from inspect import iscoroutinefunction
+from contextvars import ContextVar
 
+from typing import Callable
 from multiprocessing import current_process, Event
 
-from . import Public
+from . import Public, Codec
 
 if Public.TYPE_CHECKING:
-    from .Public import (WorkerProcessConfig, WorkerTaskData, )
+    from .Public import (WorkerProcessConfig, WorkerTaskData, WorkerTaskReport, )
 
 
-def workerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
-    initTime = time.time()
+def loadTask(taskData: WorkerTaskData, *_, workerConfig: WorkerProcessConfig) -> tuple:
+    """
+    解析任务配置，返回 (taskSn, taskName, execTimeLimit, taskFunc, taskArgs, taskKwargs)
+    """
+    taskSn = taskData['taskSn']
+    execTimeLimit = taskData['execTimeLimit']
+    funcPath = taskData['funcPath']
+    taskName = taskData['name']
+
+    missCount = Public.importCacheStat['miss']
+    taskFunc = Public.importFunction(funcPath)
+    if Public.importCacheStat['miss'] > missCount:
+        workerConfig.pipe.send(('funcPath', funcPath))  # 新导入的函数记录到群集，重启后预先导入
+
+    taskArgs = Codec.decode(taskData['argsStr'], taskData.get('argsCodec'))
+    taskKwargs = Codec.decode(taskData['kwargsStr'], taskData.get('argsCodec'))
+    return taskSn, taskName, execTimeLimit, taskFunc, taskArgs, taskKwargs
+
+
+def invalidConfigReport(taskData: WorkerTaskData, *_, workerNamePrint: str) -> WorkerTaskReport:
+    print(f'{workerNamePrint} >>> 任务配置无效')
+    return dict(
+        taskSn=taskData.get('taskSn') if isinstance(taskData, dict) else None,
+        state='invalidConfig',
+        detail=traceback.format_exc(),
+    )
+
+
+def timeoutReport(
+        taskSn: int, taskName: str, *_, workerNamePrint: str, execWarn: str | None, detail: str | None = None,
+) -> WorkerTaskReport:
+    print(f'{workerNamePrint} 任务超时 {taskSn} - {taskName}')
+    return dict(
+        taskSn=taskSn, state='timeout',
+        message='任务超时', detail=detail or traceback.format_exc(), execWarn=execWarn,
+    )
+
+
+def crashReport(
+        taskSn: int, taskName: str, exception_: BaseException, *_, workerNamePrint: str, execWarn: str | None,
+) -> WorkerTaskReport:
+    print(f'{workerNamePrint} 任务失败 {taskSn} - {taskName} \n  >>>  {exception_}')
+    return dict(
+        taskSn=taskSn, state='crash',
+        message=str(exception_), detail=traceback.format_exc(), execWarn=execWarn,
+    )
+
+
+def softTimeoutHandler(*_):
+    raise Public.TaskTimeout('任务超时')
+
+
+def executeTask(taskData: WorkerTaskData, *_, workerConfig: WorkerProcessConfig, workerNamePrint: str) -> WorkerTaskReport:
+    # -------------------- config check & unpack --------------------
+    try:
+        taskSn, taskName, execTimeLimit, taskFunc, taskArgs, taskKwargs = loadTask(
+            taskData, workerConfig=workerConfig,
+        )
+    except:
+        return invalidConfigReport(taskData, workerNamePrint=workerNamePrint)
+
+    # print(f'{workerNamePrint} >>> 拉取任务 {taskSn} - {taskName}')
+
+    # -------------------- send time limit --------------------
+    softTimeout = Public.CONFIG.softTimeout and hasattr(signal, 'setitimer')
+    workerConfig.stateTable.beat(
+        workerConfig.sn, taskSn=taskSn,
+        deadline=time.time() + execTimeLimit + (Public.CONFIG.hardTimeoutDelay if softTimeout else 0),
+    )  # 软超时先中断任务，群集的强制终止延后
+
+    # -------------------- executor task --------------------
+    execWarn: str | None = None
+    startTime = time.time()
+    with Public.catch_warnings(record=True) as warnMsgArr:  # 捕获 warnings
+        try:
+            if iscoroutinefunction(taskFunc):  # 协程任务在事件循环中执行
+                result = asyncio.run(asyncio.wait_for(taskFunc(*taskArgs, **taskKwargs), timeout=execTimeLimit))
+            elif softTimeout:
+                signal.signal(signal.SIGALRM, softTimeoutHandler)
+                signal.setitimer(signal.ITIMER_REAL, execTimeLimit)
+                try:
+                    result = taskFunc(*taskArgs, **taskKwargs)
+                finally:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+            else:
+                result = taskFunc(*taskArgs, **taskKwargs)
+        except (Exception, Public.TaskTimeout) as exception_:  # 捕获 exception
+            if warnMsgArr:
+                execWarn = '\n'.join(
+                    str(warnMsg.message) for warnMsg in warnMsgArr
+                )
+            if isinstance(exception_, (asyncio.TimeoutError, Public.TaskTimeout)):
+                return timeoutReport(taskSn, taskName, workerNamePrint=workerNamePrint, execWarn=execWarn)
+            return crashReport(taskSn, taskName, exception_, workerNamePrint=workerNamePrint, execWarn=execWarn)
+
+        if warnMsgArr:
+            execWarn = '\n'.join(
+                str(warnMsg.message) for warnMsg in warnMsgArr
+            )
+
+    # print(f'{workerNamePrint} 任务完成 {taskSn} - {taskName} @ {time.time() - startTime:.03f}s')
+
+    return dict(
+        taskSn=taskSn, state='success',
+        result=result, execWarn=execWarn,
+    )
+
+
+# -------------------- 按任务捕获 warnings --------------------
+taskWarnContext: ContextVar[list | None] = ContextVar('taskWarnContext', default=None)
+defaultShowWarning = warnings.showwarning
+
+
+def showTaskWarning(message, category, filename, lineno, file=None, line=None):
+    """
+    替换 warnings.showwarning，记录到当前任务的 context 中
+    并发执行时 catch_warnings 是进程全局的，无法区分任务
+    """
+    warnMsgArr = taskWarnContext.get()
+    if warnMsgArr is None:
+        return defaultShowWarning(message, category, filename, lineno, file, line)
+    warnMsgArr.append(message)
+
+
+def installTaskWarning():
+    warnings.showwarning = showTaskWarning
+    warnings.simplefilter('always')  # 与 catch_warnings 一致，同一位置的 warning 每次都记录
+
+
+def joinTaskWarning(warnMsgArr: list) -> str | None:
+    return '\n'.join(str(warnMsg) for warnMsg in warnMsgArr) or None
+
+
+async def executeAsyncTask(
+        taskData: WorkerTaskData, *_, workerConfig: WorkerProcessConfig, workerNamePrint: str,
+        overrunSet: set[asyncio.Future],
+) -> WorkerTaskReport:
+    """
+    在事件循环中执行任务，协程直接执行，普通函数在线程中执行，超时由 asyncio.wait_for 控制
+    线程无法中断，超时后先返回结果，线程放入 overrunSet 继续占用并发数量，直到执行结束
+    """
+    try:
+        taskSn, taskName, execTimeLimit, taskFunc, taskArgs, taskKwargs = loadTask(
+            taskData, workerConfig=workerConfig,
+        )
+    except:
+        return invalidConfigReport(taskData, workerNamePrint=workerNamePrint)
+
+    warnMsgArr = []
+    taskWarnContext.set(warnMsgArr)  # asyncio.Task 有独立的 context，只影响当前任务
+
+    try:
+        if iscoroutinefunction(taskFunc):
+            result = await asyncio.wait_for(taskFunc(*taskArgs, **taskKwargs), timeout=execTimeLimit)
+        else:
+            threadTask = asyncio.ensure_future(asyncio.to_thread(taskFunc, *taskArgs, **taskKwargs))
+            try:
+                result = await asyncio.wait_for(asyncio.shield(threadTask), timeout=execTimeLimit)
+            except asyncio.TimeoutError:
+                overrunSet.add(threadTask)
+                threadTask.add_done_callback(overrunSet.discard)
+                raise
+    except asyncio.TimeoutError:
+        return timeoutReport(taskSn, taskName, workerNamePrint=workerNamePrint, execWarn=joinTaskWarning(warnMsgArr))
+    except Exception as exception_:
+        return crashReport(
+            taskSn, taskName, exception_, workerNamePrint=workerNamePrint, execWarn=joinTaskWarning(warnMsgArr),
+        )
+
+    return dict(
+        taskSn=taskSn, state='success',
+        result=result,
+        execWarn=joinTaskWarning(warnMsgArr),
+    )
+
+
+def workerInit(workerConfig: WorkerProcessConfig) -> tuple[str, str, Event]:
     pid = current_process().pid
     workerStopEvent = Event()
     workerStopEvent.clear()
 
-    workerName = f'{Public.CONFIG.name}-{workerConfig.sn:02d}-{pid:<5d}'
+    workerName = Public.formatWorkerName(workerConfig.sn, pid)
     workerNamePrint = f'{Public.CONFIG.name}-作业器-{workerConfig.sn:02d}-{pid:<5d}'
-    workerConfig.dispatcherClient.methodBound()
 
     print(f'* {workerNamePrint} 启动 @ {Public.currentTimeStr()}')
 
@@ -31,29 +211,115 @@ def workerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
     for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGILL,):
         signal.signal(sig, stopSignalHandler)
 
-    dispatcherCheckTime = time.time()
+    # -------------------- warm up --------------------
+    warmUpFuncPath = set(Public.CONFIG.workerWarmUp) | set(workerConfig.warmUpFuncPath)
+    if warmUpFuncPath:
+        print(f'{workerNamePrint} >>> 预加载函数 {Public.warmUpFunction(warmUpFuncPath)} 个')
+
+    return workerName, workerNamePrint, workerStopEvent
+
+
+def dispatcherProxyInit(workerConfig: WorkerProcessConfig):
+    """
+    通过 taskDispatcher 代理调用调度器方法
+    直接调用注册的函数时，方法在管理器的全局锁中执行，长轮询的 getTask 会阻塞所有连接
+    """
+    workerConfig.dispatcherClient.methodBound()
+    return workerConfig.dispatcherClient.taskDispatcher()
+
+
+def workerExpired(
+        workerConfig: WorkerProcessConfig, *_,
+        initTime: float, workerNamePrint: str, workerStopEvent: Event, deadline: float = 0,
+) -> bool:
+    """
+    每次循环开始时检查关闭事件、运行时限和回收请求，需要退出时返回 True，否则发送心跳
+    """
+    # -------------------- exit event check --------------------
+    if workerConfig.clusterOffline.is_set() or workerStopEvent.is_set():
+        print(f'{workerNamePrint} >>> 进程关闭 {Public.currentTimeStr()}')
+        return True
+
+    # -------------------- work process life time --------------------
+    if time.time() - initTime > Public.CONFIG.workerLifetime:
+        print(f'{workerNamePrint} >>> 到达时限，等待重启')
+        return True
+
+    # -------------------- worker recycle --------------------
+    if workerConfig.workerRecycle.is_set():  # 群集根据内存和任务数决定回收
+        print(f'{workerNamePrint} >>> 群集要求回收，进程退出')
+        return True
+
+    # -------------------- heart beat --------------------
+    workerConfig.stateTable.beat(workerConfig.sn, deadline=deadline)
+    return False
+
+
+def workerExit(workerNamePrint: str):
+    print(
+        f'{workerNamePrint} >>> 函数缓存 '
+        f'命中 {Public.importCacheStat["hit"]} 次, 未命中 {Public.importCacheStat["miss"]} 次'
+    )
+    exit()
+
+
+def pipeWorkerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
+    """
+    群集统一获取任务时的作业器，通过 Pipe 向群集请求任务并返回结果，不直接连接调度器
+    """
+    initTime = time.time()
+    workerName, workerNamePrint, workerStopEvent = workerInit(workerConfig)
+    taskRequested = False
 
     while True:
-        # -------------------- exit event check --------------------
-        if workerConfig.clusterOffline.is_set() or workerStopEvent.is_set():
-            print(f'{workerNamePrint} >>> 进程关闭 {Public.currentTimeStr()}')
-            exit()
+        if workerExpired(
+                workerConfig, initTime=initTime, workerNamePrint=workerNamePrint, workerStopEvent=workerStopEvent,
+        ):
+            workerExit(workerNamePrint)
 
-        currentTime = time.time()
+        try:
+            # -------------------- 向群集请求任务 --------------------
+            if not taskRequested:
+                workerConfig.pipe.send(('getTask', None))
+                taskRequested = True
 
-        # -------------------- work process life time --------------------
-        if currentTime - initTime > Public.CONFIG.workerLifetime:
-            print(f'{workerNamePrint} >>> 到达时限，等待重启')
-            exit()
+            if not workerConfig.pipe.poll(min(Public.CONFIG.taskWaitTime or 5, Public.CONFIG.execTimeLimit)):
+                continue
 
-        # -------------------- heart beat --------------------
-        workerConfig.pipe.send(('alive', currentTime))
+            code, taskData = workerConfig.pipe.recv()
+            if code != 'task':
+                continue
+            taskRequested = False
+
+            report = executeTask(taskData, workerConfig=workerConfig, workerNamePrint=workerNamePrint)
+            workerConfig.pipe.send(('report', report))
+            workerConfig.stateTable.addTaskCount(workerConfig.sn)
+
+        except Exception as exception_:
+            print(f'* {workerNamePrint} 运行错误 @ {Public.currentTimeStr()} : {exception_}')
+
+
+def workerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
+    initTime = time.time()
+    workerName, workerNamePrint, workerStopEvent = workerInit(workerConfig)
+    dispatcherProxy = dispatcherProxyInit(workerConfig)
+
+    dispatcherCheckTime = time.time()
+
+    while True:
+        if workerExpired(
+                workerConfig, initTime=initTime, workerNamePrint=workerNamePrint, workerStopEvent=workerStopEvent,
+        ):
+            workerExit(workerNamePrint)
+        currentTime = time.time()
 
         try:
             # -------------------- 获取任务配置 --------------------
             fetchData: str | int = Public.remoteProxyCall(
-                func=workerConfig.dispatcherClient.getTask,
+                func=dispatcherProxy.getTask,
                 workerName=workerName,
+                combine=Public.CONFIG.taskCombine,
+                wait=min(Public.CONFIG.taskWaitTime, Public.CONFIG.execTimeLimit),  # 等待时间不超过心跳时限
             )  # 从 dispatcher 获取 taskInfo
 
             # -------------------- refresh dispatcher check time --------------------
@@ -63,76 +329,76 @@ def workerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
                 time.sleep(0.5)
                 continue
             if fetchData == 0:
-                # print(f'{workerNamePrint} >>> 队列为空，等待中')  # 0 表示目前没有任务，暂停 5 秒
-                time.sleep(10)
+                # print(f'{workerNamePrint} >>> 队列为空，等待中')  # 0 表示目前没有任务
+                if not Public.CONFIG.taskWaitTime:  # 长轮询已在调度器等待，否则暂停 10 秒
+                    time.sleep(10)
                 continue
             if fetchData == -1:  # -1 表示管理器进入关闭状态，退出循环
                 break
 
-                # -------------------- config check & unpack --------------------
-
-            try:
-                taskData: WorkerTaskData = Public.CONFIG.handler.deserialize(fetchData)  # 解析 taskData 的数据
-                taskSn = taskData['taskSn']
-                execTimeLimit = taskData['execTimeLimit']
-                funcPath = taskData['funcPath']
-                taskName = taskData['name']
+            # -------------------- 批量任务 --------------------
+            if Public.CONFIG.taskCombine > 1:
+                reportArr: list[WorkerTaskReport] = []
+                try:
+                    taskDataArr: list[WorkerTaskData] = Public.CONFIG.handler.deserialize(fetchData)
+                except:
+                    print(f'{workerNamePrint} >>> 任务配置无效')
+                    Public.remoteProxyCall(
+                        dispatcherProxy.invalidConfig,
+                        detail=traceback.format_exc(),
+                        runningWorkerName=workerName,
+                    )  # 发送 invalidConfig 错误
+                    continue
 
-                taskFunc = Public.importFunction(funcPath)
+                for taskData in taskDataArr:
+                    reportArr.append(
+                        executeTask(taskData, workerConfig=workerConfig, workerNamePrint=workerNamePrint)
+                    )
 
-                taskArgs = taskData['args']
-                taskKwargs = taskData['kwargs']
-            except:
-                print(f'{workerNamePrint} >>> 任务配置无效')
                 Public.remoteProxyCall(
-                    workerConfig.dispatcherClient.invalidConfig,
-                    detail=traceback.format_exc(),
-                    runningWorkerName=workerName,
-                )  # 发送 invalidConfig 错误
+                    dispatcherProxy.taskReport,  # 批量发送任务结果
+                    reportArr=reportArr,
+                )
+                workerConfig.stateTable.addTaskCount(workerConfig.sn, len(reportArr))
                 continue
 
-            # print(f'{workerNamePrint} >>> 拉取任务 {taskSn} - {taskName}')
+            # -------------------- 单个任务 --------------------
+            try:
+                taskData: WorkerTaskData = Public.CONFIG.handler.deserialize(fetchData)  # 解析 taskData 的数据
+            except:
+                taskData = None
 
-            # -------------------- send time limit --------------------
-            workerConfig.pipe.send(('timeLimit', execTimeLimit))
+            report = executeTask(taskData, workerConfig=workerConfig, workerNamePrint=workerNamePrint)
 
-            # -------------------- executor task --------------------
-            execWarn: str | None = None
-            exception = None
-            crashDetail = None
-            startTime = time.time()
-            with Public.catch_warnings(record=True) as warnMsgArr:  # 捕获 warnings
-                try:
-                    result = taskFunc(*taskArgs, **taskKwargs)
-                except Exception as exception_:  # 捕获 exception
-                    print(f'{workerNamePrint} 任务失败 {taskSn} - {taskName} \n  >>>  {exception_}')
-                    exception = exception_
-                    crashDetail = traceback.format_exc()
-                if warnMsgArr:
-                    execWarn = '\n'.join(
-                        str(warnMsg.message) for warnMsg in warnMsgArr
+            match report['state']:
+                case 'timeout':
+                    Public.remoteProxyCall(
+                        dispatcherProxy.taskReport,
+                        reportArr=[report],
+                    )  # 发送 timeout 错误
+                case 'invalidConfig':
+                    Public.remoteProxyCall(
+                        dispatcherProxy.invalidConfig,
+                        detail=report['detail'],
+                        runningWorkerName=workerName,
+                    )  # 发送 invalidConfig 错误
+                case 'crash':
+                    Public.remoteProxyCall(
+                        dispatcherProxy.taskCrash,
+                        taskSn=report['taskSn'],
+                        message=report['message'],
+                        detail=report['detail'],
+                        execWarn=report['execWarn'],
+                    )  # 发送 taskCrash 错误
+                case 'success':
+                    Public.remoteProxyCall(
+                        dispatcherProxy.taskSuccess,  # 发送 taskSuccess
+                        taskSn=report['taskSn'],
+                        result=report['result'],
+                        execWarn=report['execWarn'],
                     )
-
-            if exception is not None:
-                # -------------------- after crash --------------------
-                Public.remoteProxyCall(
-                    workerConfig.dispatcherClient.taskCrash,
-                    taskSn=taskSn,
-                    message=str(exception),
-                    detail=crashDetail,
-                    execWarn=execWarn,
-                )  # 发送 taskCrash 错误
-                continue
-
-            # print(f'{workerNamePrint} 任务完成 {taskSn} - {taskName} @ {time.time() - startTime:.03f}s')
-
-            Public.remoteProxyCall(
-                workerConfig.dispatcherClient.taskSuccess,  # 发送 taskSuccess
-                taskSn=taskSn,
-                result=result,
-                execWarn=execWarn,
-            )
-            time.sleep(0.1)
+                    time.sleep(0.1)
+            workerConfig.stateTable.addTaskCount(workerConfig.sn)
 
             # -------------------- 捕获 TimeoutException --------------------
         except Public.ProxyTimeout as exception_:
@@ -148,3 +414,281 @@ def workerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
 
         except Exception as exception_:
             print(f'* {workerNamePrint} 运行错误 @ {Public.currentTimeStr()} : {exception_}')
+
+
+def asyncWorkerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
+    """
+    asyncio 模式的作业器，在一个进程中并发执行最多 CONFIG.workerAsyncLimit 个任务
+    """
+    initTime = time.time()
+    workerName, workerNamePrint, workerStopEvent = workerInit(workerConfig)
+    dispatcherProxy = dispatcherProxyInit(workerConfig)
+    installTaskWarning()
+
+    asyncio.run(asyncWorkerLoop(
+        workerConfig, dispatcherProxy,
+        initTime=initTime, workerName=workerName,
+        workerNamePrint=workerNamePrint, workerStopEvent=workerStopEvent,
+    ))
+    workerExit(workerNamePrint)
+
+
+async def asyncWorkerLoop(
+        workerConfig: WorkerProcessConfig, dispatcherProxy, *_,
+        initTime: float, workerName: str, workerNamePrint: str, workerStopEvent: Event,
+):
+    runningTaskSet: set[asyncio.Task] = set()
+    overrunSet: set[asyncio.Future] = set()  # 已超时但仍在执行的普通函数线程
+    dispatcherCheckTime = time.time()
+
+    # 普通函数和结果发送都在默认线程池中执行，线程数覆盖全部并发任务，任务不会在线程池中排队
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=Public.CONFIG.workerAsyncLimit * 2 + 1)
+    )
+
+    async def runTask(taskData: WorkerTaskData):
+        report = await executeAsyncTask(
+            taskData, workerConfig=workerConfig, workerNamePrint=workerNamePrint, overrunSet=overrunSet,
+        )
+        try:
+            await asyncio.to_thread(
+                Public.remoteProxyCall,
+                dispatcherProxy.taskReport,  # 每个任务完成后单独发送结果
+                reportArr=[report],
+            )
+        except Public.ProxyTimeout:
+            print(f'{workerNamePrint} >>> 任务结果发送失败 {report.get("taskSn")}')
+        workerConfig.stateTable.addTaskCount(workerConfig.sn)
+
+    while True:
+        currentTime = time.time()
+        if workerExpired(
+                workerConfig, initTime=initTime, workerNamePrint=workerNamePrint, workerStopEvent=workerStopEvent,
+        ):
+            break
+
+        freeCount = Public.CONFIG.workerAsyncLimit - len(runningTaskSet) - len(overrunSet)
+        if freeCount <= 0:
+            await asyncio.wait(runningTaskSet | overrunSet, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            continue
+
+        try:
+            # -------------------- 获取任务配置 --------------------
+            waitTime = 0 if runningTaskSet else min(Public.CONFIG.taskWaitTime, Public.CONFIG.execTimeLimit)
+            fetchData: str | int = await asyncio.to_thread(
+                Public.remoteProxyCall,
+                dispatcherProxy.getTask,
+                workerName=workerName,
+                combine=freeCount,
+                multi=True,
+                wait=waitTime,
+            )
+            dispatcherCheckTime = currentTime
+        except Public.ProxyTimeout:
+            print(f'{workerNamePrint} >>> 调度器连接失败')
+            if currentTime - dispatcherCheckTime > Public.CONFIG.dispatcherTimeout:
+                print(f'{workerNamePrint} >>> 调度器连接超时，进程退出')
+                break
+            await asyncio.sleep(5)
+            continue
+
+        if fetchData == -1:  # -1 表示管理器进入关闭状态，退出循环
+            break
+
+        if not isinstance(fetchData, str):
+            if runningTaskSet:
+                await asyncio.wait(runningTaskSet, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            elif not Public.CONFIG.taskWaitTime:
+                await asyncio.sleep(10)
+            continue
+
+        try:
+            taskDataArr: list[WorkerTaskData] = Public.CONFIG.handler.deserialize(fetchData)
+        except Exception as exception_:
+            print(f'* {workerNamePrint} 运行错误 @ {Public.currentTimeStr()} : {exception_}')
+            continue
+
+        for taskData in taskDataArr:
+            runningTask = asyncio.create_task(runTask(taskData))
+            runningTaskSet.add(runningTask)
+            runningTask.add_done_callback(runningTaskSet.discard)
+
+    # -------------------- 等待执行中的任务完成 --------------------
+    if runningTaskSet:
+        await asyncio.wait(runningTaskSet)
+
+
+def runThreadTask(
+        taskSn: int, taskName: str, taskFunc: Callable, taskArgs: list, taskKwargs: dict,
+        *_, execTimeLimit: int, workerNamePrint: str, deadlineDict: dict[int, float],
+) -> WorkerTaskReport:
+    """
+    在线程池中执行任务，warnings 记录在当前线程的 context 中
+    开始执行时在 deadlineDict 中记录超时时间，排队等待线程的任务不计时
+    """
+    deadlineDict[taskSn] = time.time() + execTimeLimit
+    warnMsgArr = []
+    taskWarnContext.set(warnMsgArr)
+
+    try:
+        if iscoroutinefunction(taskFunc):
+            result = asyncio.run(asyncio.wait_for(taskFunc(*taskArgs, **taskKwargs), timeout=execTimeLimit))
+        else:
+            result = taskFunc(*taskArgs, **taskKwargs)
+    except asyncio.TimeoutError:
+        return timeoutReport(taskSn, taskName, workerNamePrint=workerNamePrint, execWarn=joinTaskWarning(warnMsgArr))
+    except Exception as exception_:
+        return crashReport(
+            taskSn, taskName, exception_, workerNamePrint=workerNamePrint, execWarn=joinTaskWarning(warnMsgArr),
+        )
+    finally:
+        deadlineDict.pop(taskSn, None)
+
+    return dict(
+        taskSn=taskSn, state='success',
+        result=result, execWarn=joinTaskWarning(warnMsgArr),
+    )
+
+
+def threadWorkerFunc(workerConfig: WorkerProcessConfig, *args, **kwargs):
+    """
+    线程池模式的作业器，在一个进程中并发执行最多 CONFIG.workerThreadLimit 个任务
+    适用于释放 GIL 的任务，Pipe 和调度器连接只在主线程使用
+    线程无法中断，任务超时后先按超时上报，作业器不再获取任务，其他任务完成后退出
+    """
+    initTime = time.time()
+    workerName, workerNamePrint, workerStopEvent = workerInit(workerConfig)
+    dispatcherProxy = dispatcherProxyInit(workerConfig)
+    installTaskWarning()
+
+    executor = ThreadPoolExecutor(max_workers=Public.CONFIG.workerThreadLimit)
+    runningDict: dict[Future, tuple[int, str]] = {}  # future: (taskSn, taskName)
+    deadlineDict: dict[int, float] = {}  # taskSn: 超时时间，任务开始执行时由线程写入
+    overrunSet: set[int] = set()  # 已按超时上报，线程仍在执行的任务
+    reportArr: list[WorkerTaskReport] = []
+    dispatcherCheckTime = time.time()
+
+    def checkOverrun() -> float:
+        """
+        超过时限的任务按超时上报，返回群集强制终止作业器的时间
+        有超时任务时等待其他任务完成，否则按最早到期的任务再加 hardTimeoutDelay
+        """
+        currentTime = time.time()
+        deadlineArr = []
+        for future, (taskSn, taskName) in runningDict.items():
+            deadline = deadlineDict.get(taskSn)
+            if not deadline or taskSn in overrunSet:
+                continue
+            if deadline < currentTime and not future.done():
+                overrunSet.add(taskSn)
+                reportArr.append(timeoutReport(
+                    taskSn, taskName, workerNamePrint=workerNamePrint, execWarn=None,
+                    detail='线程无法中断，任务仍在执行，作业器完成其他任务后退出',
+                ))
+                continue
+            deadlineArr.append(deadline)
+
+        if not deadlineArr and not overrunSet:
+            return 0
+        if overrunSet:
+            return max(deadlineArr, default=currentTime) + Public.CONFIG.hardTimeoutDelay
+        return min(deadlineArr) + Public.CONFIG.hardTimeoutDelay
+
+    def sendReport():
+        doneArr = [future for future in runningDict if future.done()]
+        for future in doneArr:
+            taskSn, _ = runningDict.pop(future)
+            if taskSn in overrunSet:  # 已经按超时上报
+                overrunSet.discard(taskSn)
+                continue
+            reportArr.append(future.result())
+        if doneArr:
+            workerConfig.stateTable.addTaskCount(workerConfig.sn, len(doneArr))
+        if not reportArr:
+            return
+        try:
+            Public.remoteProxyCall(dispatcherProxy.taskReport, reportArr=reportArr)  # 批量发送结果
+            reportArr.clear()
+        except Public.ProxyTimeout:
+            print(f'{workerNamePrint} >>> 任务结果发送失败')
+
+    while True:
+        currentTime = time.time()
+        deadline = checkOverrun()
+        sendReport()
+
+        if workerExpired(
+                workerConfig, initTime=initTime, workerNamePrint=workerNamePrint, workerStopEvent=workerStopEvent,
+                deadline=deadline,
+        ):
+            break
+
+        # -------------------- 有超时任务时不再获取任务 --------------------
+        if overrunSet:
+            if len(overrunSet) >= len(runningDict):
+                print(f'{workerNamePrint} >>> 任务超时无法中断，进程退出')
+                break
+            wait(runningDict, timeout=1, return_when=FIRST_COMPLETED)
+            continue
+
+        freeCount = Public.CONFIG.workerThreadLimit - len(runningDict)
+        if freeCount <= 0:
+            wait(runningDict, timeout=1, return_when=FIRST_COMPLETED)
+            continue
+
+        try:
+            # -------------------- 获取任务配置 --------------------
+            fetchData: str | int = Public.remoteProxyCall(
+                func=dispatcherProxy.getTask,
+                workerName=workerName,
+                combine=freeCount,
+                multi=True,
+                wait=0 if runningDict else min(Public.CONFIG.taskWaitTime, Public.CONFIG.execTimeLimit),
+            )
+            dispatcherCheckTime = currentTime
+        except Public.ProxyTimeout:
+            print(f'{workerNamePrint} >>> 调度器连接失败')
+            if currentTime - dispatcherCheckTime > Public.CONFIG.dispatcherTimeout:
+                print(f'{workerNamePrint} >>> 调度器连接超时，进程退出')
+                break
+            time.sleep(5)
+            continue
+
+        if fetchData == -1:  # -1 表示管理器进入关闭状态，退出循环
+            break
+
+        if not isinstance(fetchData, str):
+            if runningDict:
+                wait(runningDict, timeout=1, return_when=FIRST_COMPLETED)
+            elif not Public.CONFIG.taskWaitTime:
+                time.sleep(10)
+            continue
+
+        try:
+            taskDataArr: list[WorkerTaskData] = Public.CONFIG.handler.deserialize(fetchData)
+        except Exception as exception_:
+            print(f'* {workerNamePrint} 运行错误 @ {Public.currentTimeStr()} : {exception_}')
+            continue
+
+        for taskData in taskDataArr:
+            try:
+                taskSn, taskName, execTimeLimit, taskFunc, taskArgs, taskKwargs = loadTask(
+                    taskData, workerConfig=workerConfig,
+                )
+            except:
+                reportArr.append(invalidConfigReport(taskData, workerNamePrint=workerNamePrint))
+                continue
+
+            future = executor.submit(
+                runThreadTask, taskSn, taskName, taskFunc, taskArgs, taskKwargs,
+                execTimeLimit=execTimeLimit, workerNamePrint=workerNamePrint, deadlineDict=deadlineDict,
+            )
+            runningDict[future] = (taskSn, taskName)
+
+    # -------------------- 等待执行中的任务完成 --------------------
+    if overrunSet:  # 超时的线程无法结束，等待其他任务完成，之后由群集在 hardTimeoutDelay 后终止进程
+        workerConfig.stateTable.beat(workerConfig.sn, deadline=checkOverrun())
+        wait([future for future, (taskSn, _) in runningDict.items() if taskSn not in overrunSet])
+    executor.shutdown(wait=not overrunSet)
+    sendReport()
+    workerExit(workerNamePrint)
@@ -0,0 +1,57 @@
+"""
+比较各序列化格式的速度和大小，在 Django 项目中运行：
+    DJANGO_SETTINGS_MODULE=xxx.settings python -m DjangoAutoTask.benchmark.codecBenchmark
+"""
+from __future__ import annotations
+
+import time
+import random
+
+import django
+
+django.setup()
+
+from DjangoAutoTask import Codec
+
+
+def payloadDict() -> dict[str, dict | list]:
+    """
+    常见的任务参数和结果
+    """
+    random.seed(0)
+    return {
+        'small kwargs': {'userId': 10086, 'mode': 'full', 'retry': True, 'tags': ['a', 'b']},
+        'records 100KB': {
+            'rows': [
+                {'id': i, 'name': f'item-{i}', 'price': random.random() * 100, 'stock': random.randint(0, 999)}
+                for i in range(1500)
+            ],
+        },
+        'numbers 1MB': [random.random() for _ in range(50000)],
+        'text 1MB': {'content': ''.join(random.choice('abcdefghij 中文') for _ in range(500000))},
+    }
+
+
+def measure(func, *args, repeat: int) -> float:
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - startTime) / repeat * 1000
+
+
+def main():
+    print(f'{"payload":<16}{"codec":<10}{"size":>12}{"encode ms":>12}{"decode ms":>12}')
+    for payloadName, payload in payloadDict().items():
+        repeat = 2000 if payloadName == 'small kwargs' else 20
+        for codecName, codec in Codec.codecDict.items():
+            dataStr = codec.encode(payload)
+            assert codec.decode(dataStr) == payload
+            print(
+                f'{payloadName:<16}{codecName:<10}{len(dataStr):>12}'
+                f'{measure(codec.encode, payload, repeat=repeat):>12.3f}'
+                f'{measure(codec.decode, dataStr, repeat=repeat):>12.3f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
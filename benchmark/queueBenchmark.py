@@ -0,0 +1,96 @@
+"""
+比较调度器队列的内存占用和建立时间，在 Django 项目中运行：
+    DJANGO_SETTINGS_MODULE=xxx.settings python -m DjangoAutoTask.benchmark.queueBenchmark [队列长度]
+旧方式：每个任务一个 TaskData，包含参数字符串
+新方式：每个任务一个 __slots__ 的 TaskState，参数在分配任务时读取
+"""
+from __future__ import annotations
+
+import sys
+import time
+import heapq
+import tracemalloc
+
+import django
+
+django.setup()
+
+from DjangoAutoTask import Public
+
+
+def taskRowArr(queueSize: int) -> list[tuple]:
+    """
+    模拟 values_list 的结果，每条记录的字符串都是独立对象
+    """
+    return [
+        (
+            taskSn, 1000 + taskSn % 7, 20, f'task-{taskSn}', ''.join(('app.tasks.', 'sync', 'Order')),
+            f'order-{taskSn % 50}' if taskSn % 3 else None,
+            f'[{taskSn}, "{"x" * 100}"]', '{"mode": "full", "retry": true}',
+        )
+        for taskSn in range(1, queueSize + 1)
+    ]
+
+
+def buildTaskData(rowArr: list[tuple]) -> list:
+    return [
+        Public.TaskData(
+            taskSn=taskSn, priority=priority, execTimeLimit=execTimeLimit, name=name, funcPath=funcPath,
+            blockKey=blockKey, argsStr=argsStr, kwargsStr=kwargsStr,
+        ) for taskSn, priority, execTimeLimit, name, funcPath, blockKey, argsStr, kwargsStr in rowArr
+    ]
+
+
+def buildTaskState(rowArr: list[tuple]) -> list:
+    return [
+        Public.TaskState(
+            taskSn, priority, execTimeLimit, name, sys.intern(funcPath), blockKey and sys.intern(blockKey),
+        ) for taskSn, priority, execTimeLimit, name, funcPath, blockKey, _, _ in rowArr
+    ]
+
+
+def retainedStrSize(entryArr: list) -> int:
+    """
+    队列引用的字符串大小，相同的字符串对象只计算一次
+    """
+    strDict = {}
+    for entry in entryArr:
+        for fieldName in ('name', 'funcPath', 'blockKey', 'argsStr', 'kwargsStr'):
+            value = getattr(entry, fieldName, None)
+            if isinstance(value, str):
+                strDict[id(value)] = sys.getsizeof(value)
+    return sum(strDict.values())
+
+
+def measure(buildFunc, queueSize: int) -> tuple[float, float]:
+    """
+    返回 (每个任务的字节数, 建立队列的毫秒数)
+    字节数为新建的对象加上队列引用的字符串，建立时间不开启 tracemalloc 单独测量
+    """
+    rowArr = taskRowArr(queueSize)
+    startTime = time.perf_counter()
+    queue = [(entry.priority, index, entry) for index, entry in enumerate(buildFunc(rowArr))]
+    heapq.heapify(queue)
+    costTime = (time.perf_counter() - startTime) * 1000
+    del queue
+
+    rowArr = taskRowArr(queueSize)
+    tracemalloc.start()
+    entryArr = buildFunc(rowArr)
+    queue = [(entry.priority, index, entry) for index, entry in enumerate(entryArr)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (memory + retainedStrSize(entryArr)) / queueSize, costTime
+
+
+def main():
+    queueSize = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f'队列长度 {queueSize}')
+    print(f'{"representation":<16}{"bytes/entry":>14}{"build ms":>12}')
+    for name, buildFunc in (('TaskData', buildTaskData), ('TaskState', buildTaskState)):
+        bytesPerEntry, costTime = measure(buildFunc, queueSize)
+        print(f'{name:<16}{bytesPerEntry:>14.0f}{costTime:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+TaskRec 队列查询的索引测试，写入大量历史记录后比较有无索引时 getTaskQueue 的耗时
+会清空 TaskRec，请使用单独的数据库运行：
+    DJANGO_SETTINGS_MODULE=xxx.settings python -m DjangoAutoTask.benchmark.queueIndexBenchmark --reset [记录数] [等待执行比例]
+"""
+from __future__ import annotations
+
+import sys
+import time
+import random
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from DjangoAutoTask.models import TaskRec
+
+
+def seedTaskRec(rowCount: int, readyRatio: float):
+    """
+    写入 rowCount 条记录，其中 readyRatio 为等待执行的任务，其余为已完成/失败的历史记录
+    """
+    TaskRec.objects.all().delete()
+    random.seed(0)
+    currentTime = int(time.time())
+    stateArr = (TaskRec.TaskStateChoice.success, ) * 9 + (TaskRec.TaskStateChoice.fail, )
+
+    batchSize = 10000
+    for start in range(0, rowCount, batchSize):
+        TaskRec.objects.bulk_create(
+            TaskRec(
+                name=f'task-{index}', createUser='benchmark', funcPath='app.tasks.syncOrder',
+                argsStr='[]', kwargsStr='{}',
+                createTime=currentTime - rowCount + index, taskStateTime=currentTime - rowCount + index,
+                priority=random.choice((500, 1000, 1000, 1000)),
+                taskState=TaskRec.TaskStateChoice.init if random.random() < readyRatio else random.choice(stateArr),
+            ) for index in range(start, min(start + batchSize, rowCount))
+        )
+        print(f'\r写入 {min(start + batchSize, rowCount)} / {rowCount}', end='')
+    print()
+
+
+def measureQuery(repeat: int = 5, **kwargs) -> float:
+    startTime = time.perf_counter()
+    for _ in range(repeat):
+        list(TaskRec.exportQueryTaskState(TaskRec.getTaskQueue(**kwargs)))
+    return (time.perf_counter() - startTime) / repeat * 1000
+
+
+def queryPlan(**kwargs) -> str:
+    sql, params = TaskRec.getTaskQueue(**kwargs).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {"QUERY PLAN " if connection.vendor == "sqlite" else ""}{sql}', params)
+        return ' | '.join(str(row[-1]) for row in cursor.fetchall()[:3])
+
+
+def main():
+    argArr = [arg for arg in sys.argv[1:] if arg != '--reset']
+    if '--reset' not in sys.argv:
+        print('测试会清空 TaskRec，确认使用测试数据库后添加 --reset 参数')
+        return
+
+    rowCount = int(argArr[0]) if argArr else 1000000
+    readyRatio = float(argArr[1]) if len(argArr) > 1 else 0.01
+    seedTaskRec(rowCount, readyRatio)
+
+    changedSince = int(time.time()) - 60
+    with connection.schema_editor() as schemaEditor:
+        for index in TaskRec._meta.indexes:
+            schemaEditor.remove_index(TaskRec, index)
+
+    for indexState in ('无索引', '有索引'):
+        if indexState == '有索引':
+            with connection.schema_editor() as schemaEditor:
+                for index in TaskRec._meta.indexes:
+                    schemaEditor.add_index(TaskRec, index)
+        print(f'---------- {indexState}, {rowCount} 条记录, {readyRatio:.1%} 等待执行 ----------')
+        print(f'全量刷新 {measureQuery():.1f} ms')
+        print(f'增量刷新 {measureQuery(changedSince=changedSince):.1f} ms')
+        print(f'查询计划 {queryPlan()}')
+
+
+if __name__ == '__main__':
+    main()
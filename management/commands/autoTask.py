@@ -1,12 +1,15 @@
 import signal
+import socket
+import select
 import time
+import warnings
 
 from django.core.management.base import BaseCommand, no_translations
 
 from ...Public import currentTimeStr, CONFIG
 from ...Dispatcher import (DispatcherServer, DispatcherAdmin, DispatcherClient, )
 from ...Cluster import WorkerCluster
-from ...Worker import workerFunc
+from ...Worker import workerFunc, pipeWorkerFunc, asyncWorkerFunc, threadWorkerFunc
 from ...Handler import AutoTaskHandler
 
 
@@ -40,7 +43,43 @@ class Command(BaseCommand):
         return dispatcherAdmin
 
     @staticmethod
-    def workerClusterInit():
+    def notifySocketInit() -> socket.socket:
+        notifySocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        notifySocket.bind((CONFIG.notifyHost, CONFIG.notifyPort))  # 其他服务器创建的任务也能通知调度器
+        notifySocket.setblocking(False)
+        return notifySocket
+
+    @staticmethod
+    def waitNotify(notifySocket: socket.socket, timeout: float) -> bool:
+        """
+        等待新任务通知，收到通知返回 True
+        """
+        readable, _, _ = select.select([notifySocket], [], [], timeout)
+        if not readable:
+            return False
+
+        while True:  # 清空已收到的通知
+            try:
+                notifySocket.recv(16)
+            except BlockingIOError:
+                return True
+
+    @staticmethod
+    def selectWorkerFunc():
+        if CONFIG.clusterMultiplex:
+            if CONFIG.workerAsyncLimit > 1 or CONFIG.workerThreadLimit > 1:
+                warnings.warn('clusterMultiplex 模式下作业器逐个执行任务，忽略 workerAsyncLimit 和 workerThreadLimit')
+            return pipeWorkerFunc
+        if CONFIG.workerAsyncLimit > 1:
+            if CONFIG.workerThreadLimit > 1:
+                warnings.warn('同时设置 workerAsyncLimit 和 workerThreadLimit 时使用 asyncio 模式，忽略 workerThreadLimit')
+            return asyncWorkerFunc
+        if CONFIG.workerThreadLimit > 1:
+            return threadWorkerFunc
+        return workerFunc
+
+    @classmethod
+    def workerClusterInit(cls):
         dispatcherClient = DispatcherClient(
             address=(CONFIG.host, CONFIG.port),
             authkey=CONFIG.authKey,
@@ -49,7 +88,7 @@ class Command(BaseCommand):
 
         workerCluster = WorkerCluster(
             dispatcherConn=dispatcherClient,
-            workerFunc=workerFunc,
+            workerFunc=cls.selectWorkerFunc(),
         )
         return workerCluster
 
@@ -62,21 +101,56 @@ class Command(BaseCommand):
         time.sleep(1)
         dispatcherAdmin.connect()
 
+        notifySocket = self.notifySocketInit()
+
         print(f'调度器启动 @ {currentTimeStr()}')
 
         checkTime = 0
+        expireTime = time.time()  # 启动后等待一个间隔再清理
+        refreshTime = 0
+        queueIdle = False
+        nextDueTime = None
+        notified = False
         while True:
+            notified = self.waitNotify(notifySocket, 0.2) or notified  # 有新任务时尽快刷新队列
+
             if time.time() - checkTime > 5:
                 try:
                     isRunning = dispatcherAdmin.isRunning()._getvalue()
                     if isRunning:
                         AutoTaskHandler.taskSchemeAuto()
                     AutoTaskHandler.overtimeTaskProcess()
-                    dispatcherAdmin.refreshTaskQueue()._getvalue()
                     checkTime = time.time()
                 except Exception as error:
                     print(error)
-            time.sleep(0.2)
+
+            if time.time() - expireTime > CONFIG.retainCheckInterval:
+                try:
+                    AutoTaskHandler.pendingDepsProcess()
+                    removed = AutoTaskHandler.expireTaskProcess()
+                    if removed:
+                        print(f'清理过期任务 {removed} 个')
+                except Exception as error:
+                    print(error)
+                expireTime = time.time()
+
+            refreshInterval = CONFIG.queueRefreshInterval
+            if queueIdle:
+                refreshInterval = CONFIG.queueIdleRefreshInterval
+                if nextDueTime is not None:  # 空闲时等到下一个任务的计划时间或重试时间
+                    refreshInterval = min(refreshInterval, nextDueTime - refreshTime)
+            refreshInterval = max(refreshInterval, CONFIG.queueRefreshMinInterval)
+
+            sinceRefresh = time.time() - refreshTime
+            if (notified and sinceRefresh > CONFIG.queueRefreshMinInterval) or sinceRefresh > refreshInterval:
+                try:
+                    taskCount = dispatcherAdmin.refreshTaskQueue()._getvalue()
+                    queueIdle = not taskCount
+                    nextDueTime = AutoTaskHandler.nextDueTime() if queueIdle else None
+                    refreshTime = time.time()
+                    notified = False
+                except Exception as error:
+                    print(error)
 
     @no_translations
     def runCluster(self):
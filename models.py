@@ -1,16 +1,21 @@
 from __future__ import annotations
 
+import sys
 import time
 import warnings
 import traceback
 
+from collections import Counter
+
 from croniter import croniter
 
 from django.db import models
-from django.db.models import QuerySet, Q, F
+from django.db.models import QuerySet, Q, F, Case, When, Value, Exists, OuterRef, Subquery, Count, Min
+from django.db.models.functions import Concat, Cast, Coalesce, Greatest
 
-from django.db.models.signals import pre_delete
-from . import Public
+from django.db import transaction, connection
+from django.db.models.signals import pre_delete, post_save
+from . import Public, Codec
 
 
 def defaultExecTimeLimit() -> int:
@@ -30,7 +35,7 @@ def getNowTimeStamp() -> int:
 
 
 if Public.TYPE_CHECKING:
-    from .Public import TaskData
+    from .Public import (TaskData, TaskState, TaskPayloadType, WorkerTaskReport, Iterable, )
 
 
 #     ######            #          ##        #
@@ -66,6 +71,7 @@ class TaskFieldPublic(models.Model):
     funcPath = models.TextField(null=False, blank=False)
     argsStr = models.TextField(null=True, blank=True, default=None)
     kwargsStr = models.TextField(null=True, blank=True, default=None)
+    argsCodec = models.CharField(max_length=10, null=True, default=None)  # argsStr / kwargsStr 的序列化格式，None 为 json
 
     # configJson = models.TextField(null=False, blank=False)  # TaskConfig 的 json 数据，包含 func / args / kwargs 三部分
 
@@ -197,6 +203,7 @@ class TaskScheme(TaskFieldPublic):
             funcPath=self.funcPath,
             argsStr=self.argsStr,
             kwargsStr=self.kwargsStr,
+            argsCodec=self.argsCodec,
 
             execTimeLimit=self.execTimeLimit,
             retryDelay=self.retryDelay,
@@ -214,14 +221,21 @@ class TaskScheme(TaskFieldPublic):
 #         #     #    ##       #   #  #     #    #   #        #
 #         #      #### #  #####    #   ##   #     #   #####    #####
 
+readyQueueCondition = Q(taskState__in=(0, -10), pause=False, cancel=False, pendingDeps=0)  # 状态为 init / crash，没有 暂停/取消，依赖已完成
+
+
 class TaskRec(TaskFieldPublic):
     class Meta:
-        index_together = (
-            'taskSn', 'priority', 'previousTask',
-            'planTime', 'retryTime',
-            'taskState', 'pause', 'cancel',
+        indexes = (
+            models.Index(
+                fields=('priority', 'planTime', 'createTime'), condition=readyQueueCondition,
+                name='taskRec_readyQueue',
+            ),  # 等待执行的任务按队列顺序排列，只包含未完成的记录，不随历史记录增长
+            models.Index(fields=('taskState', 'timeout'), name='taskRec_stateTimeout'),  # running 任务的超时检查
         )
 
+    readyQueueCondition = readyQueueCondition
+
     taskSn = models.BigAutoField(primary_key=True)  # task sn
 
     # -------------------- package & scheme --------------------
@@ -247,6 +261,11 @@ class TaskRec(TaskFieldPublic):
         to='self', null=True,
         related_name='followTask', on_delete=models.PROTECT,
     )
+    dependTask = models.ManyToManyField(  # 依赖任务，可以实现 DAG，与 previousTask 同时使用
+        to='self', symmetrical=False, through='TaskDepend', through_fields=('task', 'dependTask'),
+        related_name='followDependTask',
+    )
+    pendingDeps = models.PositiveIntegerField(default=0)  # 未完成的 previousTask + dependTask 数量，为 0 才进入队列
 
     class ErrorCodeChoice(models.IntegerChoices):
         crash = 1001
@@ -254,6 +273,7 @@ class TaskRec(TaskFieldPublic):
         invalidConfig = 3001
 
     result = models.TextField(null=True, blank=False, default=None, )  # return value
+    resultCodec = models.CharField(max_length=10, null=True, default=None)  # result 的序列化格式，None 为 json
     detail = models.TextField(null=True, blank=False, default=None, )  # 记录 error / cancel 的详细信息
     execWarn = models.TextField(null=True, blank=False, default=None, )
 
@@ -301,8 +321,12 @@ class TaskRec(TaskFieldPublic):
             cls, *_,
             size: int = None,
             taskState: int = None, priority: int = None, taskType: int = None,
+            changedSince: int = None,
             **kwargs
     ) -> QuerySet[TaskRec]:
+        """
+        changedSince: 只查询该时间之后新建、状态变化、到达执行时间或前置任务状态变化的任务，用于增量刷新
+        """
         currentTime = getNowTimeStamp()
 
         querySize = Public.CONFIG.queueSize
@@ -317,56 +341,449 @@ class TaskRec(TaskFieldPublic):
         if isinstance(priority, int):
             qConfig.append(Q(priority__lte=priority))
 
+        if isinstance(changedSince, int):
+            qConfig.append(
+                Q(createTime__gte=changedSince) | Q(taskStateTime__gte=changedSince) |
+                Q(planTime__gte=changedSince) | Q(retryTime__gte=changedSince)
+            )  # pendingDeps 减少时会更新 taskStateTime
+
         if isinstance(taskState, int):
             qConfig.append(Q(taskState=taskState))  # 有 state 就查询对应的状态
+            qConfig.append(Q(pause=False, cancel=False, pendingDeps=0))  # 没有 暂停/取消，依赖已完成
         else:
-            qConfig.append(
-                ~Q(taskState=cls.TaskStateChoice.running)  # 状态不是 running
-            )
-            qConfig.append(
-                Q(
-                    taskState__gt=cls.TaskStateChoice.fail,  # 状态介于 fail 和 success 之间
-                    taskState__lt=cls.TaskStateChoice.success,
-                )
-            )
+            qConfig.append(cls.readyQueueCondition)  # 与 taskRec_readyQueue 索引条件相同，数据库才能使用部分索引
 
         taskQuery = cls.objects.filter(
-            Q(previousTask__isnull=True) | Q(previousTask__taskState__gte=cls.TaskStateChoice.success),  # 没有前置任务或已完成
             planTime__lte=currentTime, retryTime__lte=currentTime,  # planTime & retryTime 小于当前时间
-            pause=False, cancel=False,  # 没有 暂停/取消
             *qConfig,
-        ).order_by('priority', F('planTime').asc(nulls_last=True), 'createTime', )[:querySize]
+        ).order_by('priority', 'planTime', 'createTime', )[:querySize]  # planTime 不为 null，与索引顺序一致
 
         return taskQuery
 
-    taskDataValueFields = (
-        'name', 'taskSn',
-        'funcPath', 'argsStr', 'kwargsStr',
-        'blockKey', 'execTimeLimit', 'priority',
+    @classmethod
+    def nextDueTime(cls) -> int | None:
+        """
+        等待中的任务最近的 planTime / retryTime，没有则返回 None
+        """
+        currentTime = getNowTimeStamp()
+        return cls.objects.filter(
+            Q(planTime__gt=currentTime) | Q(retryTime__gt=currentTime),
+            cls.readyQueueCondition,
+        ).aggregate(dueTime=Min(Greatest('planTime', 'retryTime')))['dueTime']
+
+    taskStateValueFields = (
+        'taskSn', 'priority', 'execTimeLimit', 'name', 'funcPath', 'blockKey',
     )
 
     @classmethod
-    def exportQueryTaskData(cls, querySet: QuerySet[TaskRec]) -> tuple[TaskData, ...]:
-        taskRecValueArr = list(
-            querySet.values(*cls.taskDataValueFields)
-        )
+    def exportQueryTaskState(cls, querySet: QuerySet[TaskRec]) -> tuple[TaskState, ...]:
+        """
+        调度器队列只读取调度需要的字段，funcPath 和 blockKey 重复较多，使用 intern 只保存一份
+        """
         return tuple(
-            Public.TaskData(**taskRecValue)
-            for taskRecValue in taskRecValueArr
+            Public.TaskState(
+                taskSn, priority, execTimeLimit, name, sys.intern(funcPath), blockKey and sys.intern(blockKey),
+            ) for taskSn, priority, execTimeLimit, name, funcPath, blockKey in querySet.values_list(
+                *cls.taskStateValueFields
+            )
         )
 
+    @classmethod
+    def queryTaskPayload(cls, taskSnArr: Iterable[int]) -> dict[int, TaskPayloadType]:
+        """
+        分配任务时读取参数字符串，返回 {taskSn: (argsStr, kwargsStr, argsCodec)}
+        """
+        return {
+            taskSn: (argsStr, kwargsStr, argsCodec)
+            for taskSn, argsStr, kwargsStr, argsCodec in cls.objects.filter(
+                taskSn__in=taskSnArr,
+            ).values_list('taskSn', 'argsStr', 'kwargsStr', 'argsCodec')
+        }
+
     @classmethod
     def queryOvertimeTask(cls, ) -> QuerySet[TaskRec]:
+        """
+        timeout 已包含 hardTimeoutDelay，不会在群集强制终止作业器之前回收任务
+        """
         currentTime = getNowTimeStamp()
         return cls.objects.filter(
+            Q(timeout__isnull=False, timeout__lt=currentTime - 2) |
+            Q(
+                timeout__isnull=True,
+                startTime__lt=currentTime - F('execTimeLimit') - Public.CONFIG.hardTimeoutDelay - 2,
+            ),
+            taskState=cls.TaskStateChoice.running,
+        )
+
+    @classmethod
+    def claimableQuery(cls) -> QuerySet[TaskRec]:
+        """
+        可以设置为 running 的任务：状态不是 running/success/fail，没有暂停/取消，且依赖已完成
+        """
+        return cls.objects.filter(
+            ~Q(taskState=cls.TaskStateChoice.running),
+            taskState__gt=cls.TaskStateChoice.fail, taskState__lt=cls.TaskStateChoice.success,
+            pause=False, cancel=False, pendingDeps=0,
+        )
+
+    @classmethod
+    def claimRunning(cls, taskSn: int, workerName: str, execTimeLimit: int) -> int | None:
+        """
+        单条 UPDATE 设置 running 状态，返回超时时间，任务已被占用则返回 None
+        """
+        currentTime = getNowTimeStamp()
+        timeout = currentTime + execTimeLimit + Public.CONFIG.hardTimeoutDelay  # 软超时后等待强制终止的时间
+
+        updateCount = cls.claimableQuery().filter(
+            taskSn=taskSn,
+        ).update(
             taskState=cls.TaskStateChoice.running,
-            startTime__lt=currentTime - F('execTimeLimit') - 2,
+            taskStateTime=currentTime,
+            startTime=currentTime,
+            workerName=workerName[:30],
+            execute=F('execute') + 1,
+            timeout=timeout,
+        )
+
+        if not updateCount:
+            return None
+        return timeout
+
+    @classmethod
+    def setMultiRunning(cls, taskDataArr: Iterable[TaskData | TaskState], workerName: str) -> dict[int, int]:
+        """
+        批量设置 running 状态，任务按顺序执行，超时时间依次累加
+        返回成功设置的 {taskSn: timeout}
+        """
+        currentTime = getNowTimeStamp()
+        workerName = workerName[:30]
+
+        timeoutDict: dict[int, int] = {}
+        timeout = currentTime
+        for taskData in taskDataArr:
+            timeout += taskData.execTimeLimit + Public.CONFIG.hardTimeoutDelay
+            timeoutDict[taskData.taskSn] = timeout
+
+        if not timeoutDict:
+            return {}
+
+        cls.claimableQuery().filter(
+            taskSn__in=timeoutDict.keys(),
+        ).update(
+            taskState=cls.TaskStateChoice.running,
+            taskStateTime=currentTime,
+            startTime=currentTime,
+            workerName=workerName,
+            execute=F('execute') + 1,
+            timeout=Case(
+                *(When(taskSn=taskSn, then=Value(timeout)) for taskSn, timeout in timeoutDict.items()),
+                output_field=models.BigIntegerField(),
+            ),
+        )
+
+        runningTaskSnArr = cls.objects.filter(
+            taskSn__in=timeoutDict.keys(),
+            taskState=cls.TaskStateChoice.running,
+            workerName=workerName, startTime=currentTime,
+        ).values_list('taskSn', flat=True)
+
+        return {
+            taskSn: timeoutDict[taskSn] for taskSn in runningTaskSnArr
+        }
+
+    resultUpdateFields = (
+        'taskState', 'taskStateTime', 'result', 'resultCodec', 'execWarn',
+        'errorCode', 'errorMessage', 'detail', 'retryTime', 'endTime',
+    )
+
+    @classmethod
+    def setMultiResult(cls, reportArr: Iterable[WorkerTaskReport]) -> int:
+        """
+        批量写入任务结果，一次查询 + 一次 bulk_update
+        report 中的 result 需要已经序列化
+        """
+        reportDict = {
+            report.get('taskSn'): report for report in reportArr
+        }
+        taskRecArr = cls.objects.filter(
+            taskSn__in=reportDict.keys(),
+            taskState=cls.TaskStateChoice.running,
+        )
+
+        updateArr = []
+        successArr = []
+        for taskRec in taskRecArr:
+            report = reportDict[taskRec.taskSn]
+            if report.get('state') == 'success':
+                updated = taskRec.setSuccess(
+                    result=report.get('result'), resultCodec=report.get('resultCodec'),
+                    execWarn=report.get('execWarn'), save=False,
+                )
+                if updated:
+                    successArr.append(taskRec.taskSn)
+            else:
+                updated = taskRec.setError(
+                    errorCode=cls.ErrorCodeChoice(report.get('errorCode', cls.ErrorCodeChoice.crash)),
+                    message=report.get('message'), detail=report.get('detail'),
+                    execWarn=report.get('execWarn'), save=False,
+                )
+            if updated:
+                updateArr.append(taskRec)
+
+        if updateArr:
+            with transaction.atomic():
+                cls.objects.bulk_update(updateArr, fields=cls.resultUpdateFields)
+                cls.releaseDepend(successArr)
+        return len(updateArr)
+
+    @classmethod
+    def releaseDepend(cls, taskSnArr: list[int]) -> int:
+        """
+        任务成功后减少后续任务的 pendingDeps，按减少的数量分组 UPDATE，通常只有一组
+        同时更新 taskStateTime，增量刷新可以发现进入队列的任务
+        """
+        if not taskSnArr:
+            return 0
+
+        countDict = Counter(TaskDepend.objects.filter(dependTask_id__in=taskSnArr).values_list('task_id', flat=True))
+        countDict.update(cls.objects.filter(previousTask_id__in=taskSnArr).values_list('taskSn', flat=True))
+
+        groupDict: dict[int, list[int]] = {}
+        for taskSn, count in countDict.items():
+            groupDict.setdefault(count, []).append(taskSn)
+
+        currentTime = getNowTimeStamp()
+        updated = 0
+        for count, followArr in groupDict.items():
+            updated += cls.objects.filter(taskSn__in=followArr, pendingDeps__gte=count).update(
+                pendingDeps=F('pendingDeps') - count, taskStateTime=currentTime,
+            )
+        if updated:
+            transaction.on_commit(Public.notifyTaskCreated)  # 后续任务可能已进入队列，通知调度器刷新
+        return updated
+
+    @classmethod
+    def recountPendingDeps(cls, querySet: QuerySet[TaskRec]) -> int:
+        """
+        按 previousTask 和 dependTask 的当前状态重新统计 pendingDeps，新建依赖和修复计数时使用，返回修改的数量
+        """
+        previousPending = Case(
+            When(Exists(cls.objects.filter(
+                taskSn=OuterRef('previousTask_id'), taskState__lt=cls.TaskStateChoice.success,
+            )), then=Value(1)),
+            default=Value(0),
         )
+        dependPending = Coalesce(Subquery(
+            TaskDepend.objects.filter(
+                task_id=OuterRef('taskSn'), dependTask__taskState__lt=cls.TaskStateChoice.success,
+            ).values('task_id').annotate(count=Count('*')).values('count')
+        ), Value(0))
+
+        groupDict: dict[int, list[int]] = {}
+        for taskSn, pendingDeps, currentDeps in querySet.annotate(
+                currentDeps=previousPending + dependPending,
+        ).values_list('taskSn', 'pendingDeps', 'currentDeps'):
+            if pendingDeps != currentDeps:
+                groupDict.setdefault(currentDeps, []).append(taskSn)
 
-    def updateState(self, taskState: int):
+        currentTime = getNowTimeStamp()
+        updated = 0
+        for pendingDeps, taskSnArr in groupDict.items():
+            updated += cls.objects.filter(taskSn__in=taskSnArr).update(
+                pendingDeps=pendingDeps, taskStateTime=currentTime,
+            )
+        return updated
+
+    @classmethod
+    def repairPendingDeps(cls) -> int:
+        """
+        修复等待中任务的 pendingDeps，前置任务完成与后续任务创建同时发生时计数可能没有减少
+        """
+        return cls.recountPendingDeps(cls.objects.filter(
+            pendingDeps__gt=0, taskState__in=(cls.TaskStateChoice.init, cls.TaskStateChoice.crash), cancel=False,
+        ))
+
+    @classmethod
+    def reclaimRunning(cls, querySet: QuerySet[TaskRec], message: str) -> int:
+        """
+        将 querySet 中 running 状态的任务一次 UPDATE 设置为超时，与 setError 一致：达到执行次数上限为 fail，否则等待重试
+        """
+        currentTime = getNowTimeStamp()
+        return querySet.filter(taskState=cls.TaskStateChoice.running).update(
+            taskState=Case(
+                When(execute__gte=F('execLimit'), then=Value(cls.TaskStateChoice.fail)),
+                default=Value(cls.TaskStateChoice.crash),
+            ),
+            taskStateTime=currentTime,
+            retryTime=currentTime + F('retryDelay'),
+            errorCode=cls.ErrorCodeChoice.timeout,
+            errorMessage=message,
+        )
+
+    @classmethod
+    def releaseRunning(cls, querySet: QuerySet[TaskRec]) -> int:
+        """
+        将 querySet 中已分配但未执行的 running 任务恢复为 init，不计入执行次数
+        """
+        return querySet.filter(taskState=cls.TaskStateChoice.running).update(
+            taskState=cls.TaskStateChoice.init,
+            taskStateTime=getNowTimeStamp(),
+            execute=Greatest(F('execute') - 1, 0),
+        )
+
+    @classmethod
+    def releaseFollowTask(cls, taskSnArr: Iterable[int]) -> int:
+        """
+        删除任务前一次 UPDATE 处理后续任务，与 taskRecPreDelete 一致：
+        前置任务已完成的清除关联，未完成的后续任务同时标记为取消，running 任务由调用方排除
+        """
+        taskStateDict = dict(cls.objects.filter(taskSn__in=taskSnArr).values_list('taskSn', 'taskState'))
+        doneArr = [taskSn for taskSn, taskState in taskStateDict.items() if taskState >= cls.TaskStateChoice.success]
+        undoneArr = [taskSn for taskSn, taskState in taskStateDict.items() if taskState < cls.TaskStateChoice.success]
+
+        updated = 0
+        if doneArr:
+            updated += cls.objects.filter(previousTask_id__in=doneArr).update(previousTask=None)
+        if undoneArr:
+            updated += cls.objects.filter(previousTask_id__in=undoneArr).update(
+                detail=Concat(
+                    Value('Previous task '), Cast('previousTask_id', output_field=models.CharField()), Value(' removed.'),
+                ),  # 放在 previousTask 之前，MySQL 按顺序赋值
+                cancel=True,
+                previousTask=None,
+            )
+            updated += cls.objects.filter(
+                taskSn__in=TaskDepend.objects.filter(dependTask_id__in=undoneArr).values('task_id'),
+                taskState__lt=cls.TaskStateChoice.success,
+            ).update(cancel=True, detail='Depend task removed.')
+        return updated
+
+    @classmethod
+    def expireQuery(cls) -> Q | None:
+        """
+        超过保留时间的 success / fail 任务：计划任务按 TaskScheme.retainTime，其它按 CONFIG.taskRetainTime，0 表示不清理
+        """
+        currentTime = getNowTimeStamp()
+
+        retainDict: dict[int, list[int]] = {}
+        for taskSchemeSn, retainTime in TaskScheme.objects.values_list('taskSchemeSn', 'retainTime'):
+            retainDict.setdefault(retainTime, []).append(taskSchemeSn)
+
+        qConfig = [
+            Q(taskSchemeSn__in=taskSchemeSnArr, taskStateTime__lt=currentTime - retainTime)
+            for retainTime, taskSchemeSnArr in retainDict.items() if retainTime
+        ]  # 按保留时间分组，计划数量很少
+        if Public.CONFIG.taskRetainTime:
+            qConfig.append(
+                ~Q(taskSchemeSn__in=[sn for snArr in retainDict.values() for sn in snArr]) &
+                Q(taskStateTime__lt=currentTime - Public.CONFIG.taskRetainTime)
+            )  # 计划已删除的任务也使用默认保留时间
+
+        if not qConfig:
+            return None
+
+        expireQuery = qConfig.pop()
+        for query in qConfig:
+            expireQuery |= query
+        return Q(expireQuery, taskState__in=(cls.TaskStateChoice.success, cls.TaskStateChoice.fail))
+
+    @classmethod
+    def removeExpired(cls, size: int) -> int:
+        """
+        删除一批过期任务，返回删除数量
+        先用集合 UPDATE 解除后续任务和计划的关联，再直接 DELETE，不经过逐条的 taskRecPreDelete
+        """
+        expireQuery = cls.expireQuery()
+        if expireQuery is None:
+            return 0
+
+        taskSnArr = list(cls.objects.filter(expireQuery).values_list('taskSn', flat=True)[:size])
+        if not taskSnArr:
+            return 0
+
+        return cls.removeTask(taskSnArr)
+
+    @classmethod
+    def removeTask(cls, taskSnArr: Iterable[int], step: int = 500) -> int:
+        """
+        先锁定其中不是 running 的任务，用集合 UPDATE 解除后续任务和计划的关联，再直接 DELETE，不经过逐条的 taskRecPreDelete
+        每批最多 step 个，SQL 参数不超过旧版 SQLite 的 999 个限制，返回删除数量
+        """
+        taskSnArr = list(taskSnArr)
+        quoteName = connection.ops.quote_name
+        dependTable = quoteName(TaskDepend._meta.db_table)
+        taskTable = quoteName(cls._meta.db_table)
+
+        removed = 0
+        for index in range(0, len(taskSnArr), step):
+            with transaction.atomic(), connection.cursor() as cursor:
+                stepArr = list(cls.objects.select_for_update().filter(
+                    taskSn__in=taskSnArr[index:index + step],
+                ).exclude(
+                    taskState=cls.TaskStateChoice.running,
+                ).values_list('taskSn', flat=True))
+                if not stepArr:
+                    continue
+
+                cls.releaseFollowTask(stepArr)
+                TaskScheme.objects.filter(currentTask_id__in=stepArr).update(currentTask=None)  # 与 SET_NULL 一致
+
+                placeholder = ', '.join(['%s'] * len(stepArr))
+                for field in ('task', 'dependTask'):  # 与 CASCADE 一致
+                    cursor.execute(
+                        f'DELETE FROM {dependTable} '
+                        f'WHERE {quoteName(TaskDepend._meta.get_field(field).column)} IN ({placeholder})',
+                        stepArr,
+                    )
+
+                cursor.execute(
+                    f'DELETE FROM {taskTable} WHERE {quoteName(cls._meta.pk.column)} IN ({placeholder})',
+                    stepArr,
+                )
+                removed += cursor.rowcount
+        return removed
+
+    @classmethod
+    def selectTask(
+            cls, *_,
+            tag: str = None, taskPackageSn: int = None, taskSchemeSn: int = None, funcPath: str = None,
+    ) -> QuerySet[TaskRec]:
+        """
+        按 tag / taskPackageSn / taskSchemeSn / funcPath 选择任务，批量管理使用，至少需要一个条件
+        """
+        qConfig = {
+            key: value for key, value in (
+                ('tag', tag), ('taskPackageSn', taskPackageSn), ('taskSchemeSn', taskSchemeSn), ('funcPath', funcPath),
+            ) if value is not None
+        }
+        assert qConfig, 'tag / taskPackageSn / taskSchemeSn / funcPath 至少需要一个'
+        return cls.objects.filter(**qConfig)
+
+    @classmethod
+    def cancelFollowTask(cls, taskSnArr: list[int], step: int = 1000) -> int:
+        """
+        逐层 UPDATE 取消未完成的后续任务链，每层按 step 分批，返回取消数量
+        """
+        cancelled = 0
+        while taskSnArr:
+            followArr = []
+            for index in range(0, len(taskSnArr), step):
+                stepArr = taskSnArr[index:index + step]
+                querySet = cls.objects.filter(
+                    Q(previousTask_id__in=stepArr) |
+                    Q(taskSn__in=TaskDepend.objects.filter(dependTask_id__in=stepArr).values('task_id')),
+                    taskState__lt=cls.TaskStateChoice.success, cancel=False,
+                )
+                followArr.extend(querySet.values_list('taskSn', flat=True))
+                cancelled += querySet.update(cancel=True, detail='Previous task cancelled.')
+            taskSnArr = followArr
+        return cancelled
+
+    def updateState(self, taskState: int, save: bool = True):
         self.taskState = taskState
         self.taskStateTime = getNowTimeStamp()
-        self.save()
+        if save:
+            self.save()
 
     @classmethod
     def setInvalidConfig(cls, runningWorkerName: str, detail=detail, ):
@@ -381,13 +798,15 @@ class TaskRec(TaskFieldPublic):
             )
 
     def setRunning(self, workerName: str) -> int | None:
-        if self.previousTask is not None:
-            if self.previousTask.taskState < self.TaskStateChoice.success:
-                return None
+        if self.pendingDeps:  # 依赖未完成
+            return None
 
         if self.taskState >= self.TaskStateChoice.success:
             return None
 
+        if self.taskState == self.TaskStateChoice.running:
+            return None
+
         if self.taskState <= self.TaskStateChoice.fail:
             return None
 
@@ -395,14 +814,15 @@ class TaskRec(TaskFieldPublic):
         self.workerName = workerName[:30]
 
         self.startTime = getNowTimeStamp()
+        self.timeout = self.startTime + self.execTimeLimit + Public.CONFIG.hardTimeoutDelay
 
         self.updateState(self.TaskStateChoice.running)
 
-        return self.startTime + self.execTimeLimit
+        return self.timeout
 
     def setError(
             self, errorCode: ErrorCodeChoice,
-            message: str = None, detail: str = None, execWarn: str = None,
+            message: str = None, detail: str = None, execWarn: str = None, save: bool = True,
     ) -> bool:
         if not self.taskState == self.TaskStateChoice.running:
             return False
@@ -421,31 +841,46 @@ class TaskRec(TaskFieldPublic):
 
         if errorCode == self.ErrorCodeChoice.invalidConfig:
             self.errorCode = self.ErrorCodeChoice.invalidConfig
-            self.updateState(self.TaskStateChoice.fail)
+            self.updateState(self.TaskStateChoice.fail, save=save)
             return True
 
         if self.execute >= self.execLimit:
-            self.updateState(self.TaskStateChoice.fail)
+            self.updateState(self.TaskStateChoice.fail, save=save)
             return True
 
         self.retryTime = getNowTimeStamp() + self.retryDelay
-        self.updateState(self.TaskStateChoice.crash)
+        self.updateState(self.TaskStateChoice.crash, save=save)
         return True
 
-    def setSuccess(self, result: str = None, execWarn: str | None = None, ) -> bool:
+    def setSuccess(
+            self, result: str = None, execWarn: str | None = None, save: bool = True,
+            resultCodec: str | None = None,
+    ) -> bool:
         if not self.taskState == self.TaskStateChoice.running:
             return False
 
         if isinstance(result, str):
             self.result = result
+            self.resultCodec = resultCodec
 
         if isinstance(execWarn, str):
             self.execWarn = execWarn
 
         self.endTime = getNowTimeStamp()
-        self.updateState(self.TaskStateChoice.success)
+        with transaction.atomic():
+            self.updateState(self.TaskStateChoice.success, save=save)
+            if save:  # save=False 时由调用方处理后续任务
+                self.releaseDepend([self.taskSn])
         return True
 
+    def loadResult(self):
+        """
+        按 resultCodec 解析 result，不同格式的记录可以同时存在
+        """
+        if self.result is None:
+            return None
+        return Codec.decode(self.result, self.resultCodec)
+
     # def remove(self):
     #     """
     #     对每个任务调用 remove 进行删除，不要使用 delete
@@ -475,6 +910,20 @@ class TaskRec(TaskFieldPublic):
     #     return followTaskArr
 
 
+class TaskDepend(models.Model):
+    """
+    TaskRec.dependTask 的关联表，task 依赖 dependTask
+    """
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('task', 'dependTask'), name='taskDepend_unique'),
+        )
+
+    task = models.ForeignKey(to=TaskRec, on_delete=models.CASCADE, related_name='dependLink')
+    dependTask = models.ForeignKey(to=TaskRec, on_delete=models.CASCADE, related_name='followLink')
+
+
 def taskRecPreDelete(sender, instance: TaskRec, using, origin, **kwargs):
     """
     TaskRec 删除前处理
@@ -494,6 +943,9 @@ def taskRecPreDelete(sender, instance: TaskRec, using, origin, **kwargs):
             followTask.cancel = True  # 后续任务标记为取消
             followTask.detail = f'Previous task {instance.taskSn}-{instance.name} removed.'  # 标记取消原因
             followTask.save()
+        instance.followDependTask.filter(taskState__lt=TaskRec.TaskStateChoice.success).update(
+            cancel=True, detail=f'Depend task {instance.taskSn}-{instance.name} removed.',
+        )
         return
 
     # 当前任务已完成，后续任务清除关联
@@ -507,3 +959,20 @@ pre_delete.connect(
     sender=TaskRec,
     dispatch_uid='TaskRecPreDelete',
 )
+
+
+def taskRecPostSave(sender, instance: TaskRec, created: bool, **kwargs):
+    """
+    新建 TaskRec 后统计前置任务并通知调度器刷新队列
+    """
+    if created:
+        if instance.previousTask_id is not None:
+            TaskRec.recountPendingDeps(TaskRec.objects.filter(taskSn=instance.taskSn))
+        transaction.on_commit(Public.notifyTaskCreated)
+
+
+post_save.connect(
+    taskRecPostSave,
+    sender=TaskRec,
+    dispatch_uid='TaskRecPostSave',
+)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from . import API, Public
+from .models import TaskRec, TaskScheme, TaskPackage, TaskDepend, getNowTimeStamp
+from .Handler import AutoTaskHandler
+
+
+def addTask(a: int, b: int) -> int:
+    return a + b
+
+
+def packTask(name: str) -> Public.TaskData:
+    return Public.TaskData.pack(name=name, func=addTask, args=[1, 2])
+
+
+class AutoTaskTestCase(TransactionTestCase):
+    """
+    包中没有迁移文件，测试数据库中缺少的表按模型直接建立
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        tableSet = set(connection.introspection.table_names())
+        with connection.schema_editor() as schemaEditor:
+            for model in (TaskPackage, TaskScheme, TaskRec, TaskDepend):
+                if model._meta.db_table not in tableSet:
+                    schemaEditor.create_model(model)
+
+    @staticmethod
+    def queueName() -> list[str]:
+        return [taskRec.name for taskRec in TaskRec.getTaskQueue()]
+
+    @staticmethod
+    def runSuccess(name: str):
+        taskRec = TaskRec.objects.get(name=name)
+        assert taskRec.setRunning('test'), name
+        taskRec.setSuccess(result='3')
+
+
+class TaskDependTest(AutoTaskTestCase):
+
+    def testGraphCycleRejected(self):
+        with self.assertRaises(AssertionError):
+            API.createTaskGraph([packTask('a'), packTask('b')], [(0, 1), (1, 0)])
+        self.assertFalse(TaskRec.objects.exists())
+
+    def testAddDependCycleRejected(self):
+        a, b, c = API.createTaskGraph([packTask('a'), packTask('b'), packTask('c')], [(1, 0), (2, 1)])
+        for taskSn, dependTaskSnArr in ((a.taskSn, [c.taskSn]), (a.taskSn, [a.taskSn]), (b.taskSn, [c.taskSn])):
+            with self.assertRaises(AssertionError):
+                API.addTaskDepend(taskSn, dependTaskSnArr)
+
+        API.createTaskChain(packTask('x'), packTask('y'))
+        x, y = TaskRec.objects.filter(name__in=('x', 'y')).order_by('taskSn')
+        with self.assertRaises(AssertionError):  # previousTask 也是依赖
+            API.addTaskDepend(x.taskSn, [y.taskSn])
+
+        self.assertEqual(TaskDepend.objects.count(), 2)
+
+    def testChainRelease(self):
+        API.createTaskChain(packTask('x'), packTask('y'), packTask('z'))
+        self.assertEqual(
+            list(TaskRec.objects.order_by('taskSn').values_list('pendingDeps', flat=True)), [0, 1, 1],
+        )
+        self.assertEqual(self.queueName(), ['x'])
+
+        self.runSuccess('x')
+        self.assertEqual(self.queueName(), ['y'])
+        self.runSuccess('y')
+        self.assertEqual(self.queueName(), ['z'])
+
+    def testGraphRelease(self):
+        a, b, c, d = API.createTaskGraph(
+            [packTask('a'), packTask('b'), packTask('c'), packTask('d')],
+            [(1, 0), (2, 0), (3, 1), (3, 2)],
+        )
+        self.assertEqual([taskRec.pendingDeps for taskRec in (a, b, c, d)], [0, 1, 1, 2])
+        self.assertEqual(self.queueName(), ['a'])
+
+        a.refresh_from_db()
+        a.setRunning('test')
+        TaskRec.setMultiResult([dict(taskSn=a.taskSn, state='success', result='3')])
+        self.assertEqual(sorted(self.queueName()), ['b', 'c'])
+
+        self.runSuccess('b')
+        self.assertEqual(self.queueName(), ['c'])
+        self.runSuccess('c')
+        self.assertEqual(self.queueName(), ['d'])
+
+    def testRepairPendingDeps(self):
+        z = TaskRec.objects.create(name='z', funcPath='tests.addTask')
+        w = TaskRec.objects.create(name='w', funcPath='tests.addTask')
+        self.assertEqual(API.addTaskDepend(z.taskSn, [w.taskSn]), 1)
+        self.assertEqual(self.queueName(), ['w'])
+
+        TaskRec.objects.filter(taskSn=w.taskSn).update(taskState=TaskRec.TaskStateChoice.success)  # 计数没有减少
+        self.assertEqual(self.queueName(), [])
+        self.assertEqual(TaskRec.repairPendingDeps(), 1)
+        self.assertEqual(self.queueName(), ['z'])
+
+
+class TaskClaimTest(AutoTaskTestCase):
+
+    def testNoDoubleClaim(self):
+        taskRec = TaskRec.objects.create(name='a', funcPath='tests.addTask')
+        self.assertTrue(TaskRec.claimRunning(taskSn=taskRec.taskSn, workerName='w1', execTimeLimit=60))
+        self.assertIsNone(TaskRec.claimRunning(taskSn=taskRec.taskSn, workerName='w2', execTimeLimit=60))
+
+        taskStateArr = TaskRec.exportQueryTaskState(TaskRec.objects.filter(taskSn=taskRec.taskSn))
+        self.assertEqual(TaskRec.setMultiRunning(taskStateArr, workerName='w3'), {})
+
+        taskRec.refresh_from_db()
+        self.assertEqual(
+            (taskRec.taskState, taskRec.workerName, taskRec.execute), (TaskRec.TaskStateChoice.running, 'w1', 1),
+        )
+
+    def testClaimSkipsWaitingTask(self):
+        a, b = API.createTaskGraph([packTask('a'), packTask('b')], [(1, 0)])
+        self.assertIsNone(TaskRec.claimRunning(taskSn=b.taskSn, workerName='w1', execTimeLimit=60))
+        self.assertEqual(
+            TaskRec.setMultiRunning(TaskRec.exportQueryTaskState(TaskRec.objects.all()), workerName='w1').keys(),
+            {a.taskSn},
+        )
+
+
+class TaskExpireTest(AutoTaskTestCase):
+
+    def testRetainTime(self):
+        currentTime = getNowTimeStamp()
+        taskScheme = TaskScheme.objects.create(
+            name='s1', funcPath='tests.addTask', retainTime=100, planTime=currentTime + 9999,
+        )
+
+        def createTaskRec(name: str, taskState: int, age: int, taskSchemeSn: int = None) -> TaskRec:
+            return TaskRec.objects.create(
+                name=name, funcPath='tests.addTask', taskState=taskState,
+                taskStateTime=currentTime - age, taskSchemeSn=taskSchemeSn,
+            )
+
+        S = TaskRec.TaskStateChoice
+        createTaskRec('oldSuccess', S.success, 10 ** 7)
+        createTaskRec('oldFail', S.fail, 10 ** 7)
+        createTaskRec('newSuccess', S.success, 10)
+        createTaskRec('oldRunning', S.running, 10 ** 7)
+        createTaskRec('oldWaiting', S.crash, 10 ** 7)
+        createTaskRec('schemeOld', S.success, 200, taskScheme.taskSchemeSn)
+        createTaskRec('schemeNew', S.success, 50, taskScheme.taskSchemeSn)
+        createTaskRec('orphanOld', S.success, 10 ** 7, 9999)  # 计划已删除，使用默认保留时间
+
+        self.assertEqual(TaskRec.removeExpired(size=2), 2)
+        self.assertEqual(AutoTaskHandler.expireTaskProcess(), 2)
+        self.assertEqual(
+            sorted(TaskRec.objects.values_list('name', flat=True)),
+            ['newSuccess', 'oldRunning', 'oldWaiting', 'schemeNew'],
+        )
+
+
+class TaskRemoveTest(AutoTaskTestCase):
+
+    def testCleanupMatchesOrmDelete(self):
+        """
+        removeTask 与逐条 delete 的 taskRecPreDelete / CASCADE / SET_NULL 结果一致
+        """
+        S = TaskRec.TaskStateChoice
+        done = TaskRec.objects.create(name='done', funcPath='tests.addTask', taskState=S.success)
+        undone = TaskRec.objects.create(name='undone', funcPath='tests.addTask')
+        running = TaskRec.objects.create(name='running', funcPath='tests.addTask', taskState=S.running)
+        TaskRec.objects.create(name='followDone', funcPath='tests.addTask', previousTask=done)
+        TaskRec.objects.create(name='followUndone', funcPath='tests.addTask', previousTask=undone)
+        TaskRec.objects.create(name='followRunning', funcPath='tests.addTask', previousTask=running)
+        dependFollow = TaskRec.objects.create(name='dependFollow', funcPath='tests.addTask')
+        API.addTaskDepend(dependFollow.taskSn, [undone.taskSn, running.taskSn])
+        taskScheme = TaskScheme.objects.create(
+            name='s1', funcPath='tests.addTask', planTime=getNowTimeStamp() + 9999, currentTask=done,
+        )
+
+        self.assertEqual(TaskRec.removeTask([done.taskSn, undone.taskSn, running.taskSn]), 2)
+
+        taskRecDict = {taskRec.name: taskRec for taskRec in TaskRec.objects.all()}
+        self.assertEqual(set(taskRecDict), {'running', 'followDone', 'followUndone', 'followRunning', 'dependFollow'})
+        self.assertEqual(
+            (taskRecDict['followDone'].previousTask_id, taskRecDict['followDone'].cancel), (None, False),
+        )
+        self.assertEqual(
+            (taskRecDict['followUndone'].previousTask_id, taskRecDict['followUndone'].cancel), (None, True),
+        )
+        self.assertEqual(
+            (taskRecDict['followRunning'].previousTask_id, taskRecDict['followRunning'].cancel),
+            (running.taskSn, False),
+        )  # running 任务不删除，关联保留
+        self.assertTrue(taskRecDict['dependFollow'].cancel)
+        self.assertEqual(
+            list(TaskDepend.objects.values_list('task_id', 'dependTask_id')), [(dependFollow.taskSn, running.taskSn)],
+        )
+
+        taskScheme.refresh_from_db()
+        self.assertIsNone(taskScheme.currentTask_id)